@@ -1,43 +1,107 @@
 from skyfield.api import EarthSatellite, load, wgs84
-from sgp4.api import Satrec, WGS72
+from skyfield.sgp4lib import theta_GMST1982
+from skyfield.timelib import julian_date
+from skyfield.constants import DAY_S
+from sgp4.api import Satrec, SatrecArray, WGS72
 #from sgp4.conveniences import dump_satrec
 #import pandas as pd
 import random
+import heapq
+import os
+import shutil
+import tempfile
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, timedelta
 from math import pi, floor
+from collections import OrderedDict, deque
 import time
 
 # for plotting orbits
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import axes3d
-from matplotlib.animation import FuncAnimation
+
+# compiled graph algorithms for the sparse matrix routing backend
+from scipy.sparse import csr_matrix
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+# plotting lives in orbit_renderer, imported on first draw (see get_renderer)
+
+# streaming TLE catalog reader for build_catalog_constellation
+import tle_reader
+
 
 # Options
 draw_static_orbits = False
 draw_dynamic_orbits = False
 testing = False
+simulate = False # step src -> dest routing over simulation_seconds after the single-instant routes in main
+simulation_seconds = 86400
+headless = False # never open a window: plots become PNGs in plot_output_dir (or are skipped when it is None)
+plot_output_dir = None
+animation_path = None # draw_dynamic_orig writes the animation here (.mp4 or .gif) instead of opening a window
+animation_frame_seconds = 60 # simulated seconds between animation frames
+animation_fps = 20
 
 # Global variables
 orbit_list = []
 sat_object_list = []
 cur_time = 0
 num_sats = 0
+renderer = None # orbit_renderer module once something has been drawn
+plot_count = 0 # numbers headless PNGs in the order they were requested
+sat_propagator = None # constellation_propagator for every satellite in sat_object_list
+sat_propagator_version = -1 # sat_registry version the propagator was built from
+cur_snapshot = None # constellation_snapshot for cur_time, reset whenever cur_time changes
+
+# All-pairs routing
+all_pairs_chunk_size = 64 # source satellites handed to a worker process at a time
 
 # Time variables
 time_scale = 0
 time_interval = 1 # interval between time increments, measured in seconds
+seed_tle_path = './STARLINK-1071.txt' # TLE the synthetic shell is cloned from
 secs_per_km = 0.0000033
+simulation_chunk_steps = 256 # timesteps propagated in one SatrecArray call by the simulation loop
+isl_bandwidth_bps = 1e9 # ISL capacity used by the packet simulator
+isl_queue_packets = 256 # drop-tail FIFO capacity of each ISL, in packets
+packet_size_bytes = 1500
+ecmp_tolerance_km = 1.0 # paths within this many km of the shortest count as equal cost; must stay below the shortest ISL
+te_iterations = 16 # rerouting rounds for min-max utilization traffic engineering
+te_penalty = 8.0 # how steeply link cost grows with utilization during rerouting
+constellation_path = None # binary constellation file; main loads it when it exists, otherwise builds the shell and saves it there
+use_ephemeris_cache = False # simulation runs read positions from the on-disk ephemeris cache instead of running SGP4
+ephemeris_cache_dir = './ephemeris_cache'
+snapshot_cache_size = 32 # number of recent constellation snapshots kept for stepping back and forth in time
+
+# WGS84 ellipsoid, matching skyfield's wgs84 geoid
+wgs84_radius_km = 6378.137
+wgs84_flattening = 1 / 298.257223563
+wgs84_e2 = 2 * wgs84_flattening - wgs84_flattening * wgs84_flattening
 
 # Orbit characteristics
 sats_per_orbit = 22
 orbit_cnt = 72
 
+# Real catalog constellation (build_catalog_constellation)
+catalog_tle_path = None # TLE catalog main builds the routing grid from instead of the synthetic shell
+catalog_name_pattern = 'STARLINK' # regex; only matching catalog entries are loaded
+plane_inc_tolerance = 0.1 # degrees; shells are split where the sorted mean inclinations jump by more than this
+plane_raan_tolerance = 1.0 # degrees; planes are split where a shell's sorted RAANs jump by more than this
+plane_mean_motion_tolerance = 0.05 # revs/day; members this far from their plane's median (orbit raising, deorbiting) are left out
+min_sats_per_plane = 5 # smaller RAAN clusters are not treated as planes of the grid
+
 # Adjacent satellite characterisitcs
 lat_range = 1 # satellites to E/W can fall within +- this value
 
 # Ground Station characteristics
 req_elev = 60
+access_step_seconds = 60 # coarse time grid for access window precomputation; passes are bracketed below req_elev so none fall between samples
+access_chunk_steps = 256 # timesteps propagated at once while building access windows
+access_refine_iterations = 12 # regula falsi iterations used to refine rise/set times between a bracket edge and the peak
+access_peak_iterations = 28 # golden-section iterations used to refine each pass's peak
+earth_mu_km3_s2 = 398600.4418
+earth_rotation_rad_s = 7.2921159e-5
+ground_access_table = None # access_window_table consulted by get_overhead_routing_sat when it covers the location and time
 
 class routing_sat:
     def __init__(self, _sat, _satnum, _orbit_number, _sat_index, _orbit_number_East, _orbit_number_West, _sat_index_North, _sat_index_South):
@@ -50,46 +114,56 @@ class routing_sat:
         self.sat_index_North = _sat_index_North
         self.sat_index_South = _sat_index_South
 
+    def get_satrec(self): # sgp4 Satrec used by the batch propagator
+        return self.sat.model
+
+    def get_name(self):
+        return getattr(self.sat, 'name', None)
+
+    def get_catalog_fields(self): # (classification, element set number, revolution number) written to constellation files
+        satrec = self.get_satrec()
+        return satrec.classification, satrec.elnum, satrec.revnum
+
     def get_curr_geocentric(self):
         return self.sat.at(cur_time)
 
+    def get_curr_position_km(self, frame='itrs'):
+        return get_constellation_state().get_position_km(self.satnum, frame)
+
     def get_sat_lat_degrees(self):
-        lat, _ = wgs84.latlon_of(self.sat.at(cur_time))
-        return lat.degrees
+        return get_constellation_snapshot().get_lat_degrees(self.satnum)
         
     def get_sat_lon_degrees(self):
-        _, lon = wgs84.latlon_of(self.sat.at(cur_time))
-        return lon.degrees
+        return get_constellation_snapshot().get_lon_degrees(self.satnum)
+
+    def get_sat_height_km(self):
+        return get_constellation_snapshot().get_height_km(self.satnum)
     
     def is_East_of(self, dest):
-        sat_geoc = self.sat.at(cur_time)
-        _, sat_lon = wgs84.latlon_of(sat_geoc)
-        dest_geoc = dest.at(cur_time)
-        _, dest_lon = wgs84.latlon_of(dest_geoc)
-        return sat_lon.degrees > dest_lon.degrees
+        _, dest_lon = get_lat_lon_degrees_of(dest)
+        return self.get_sat_lon_degrees() > dest_lon
 
     def is_North_of(self, dest):
-        sat_geoc = self.sat.at(cur_time)
-        sat_lat, _ = wgs84.latlon_of(sat_geoc)
-        dest_geoc = dest.at(cur_time)
-        dest_lat, _ = wgs84.latlon_of(dest_geoc)
-        return sat_lat.degrees > dest_lat.degrees  ### NOTE:  I don't this this is true for things in the Southern Hemisphere!!!??
+        dest_lat, _ = get_lat_lon_degrees_of(dest)
+        return self.get_sat_lat_degrees() > dest_lat  ### NOTE:  I don't this this is true for things in the Southern Hemisphere!!!??
 
     def is_overhead_of(self, dest):
+        if hasattr(dest, 'itrs_xyz'): # ground location: elevation from the snapshot's ITRS positions
+            return get_spatial_index().get_elevation_of(dest, self.satnum) > req_elev
         topo_pos = (self.sat - dest).at(cur_time)
         elev, _, _ = topo_pos.altaz()
         if elev.degrees > req_elev:
             return True
         return False
     
-    def get_sat_East(self, _lat_range = lat_range):
-        #range of satnums for target orbit
-        min_satnum = self.orbit_number_East * sats_per_orbit
-        max_satnum = min_satnum + sats_per_orbit
+    def get_sat_East(self, _lat_range = None):
+        if _lat_range is None: # argument-of-latitude neighbour from the per-snapshot resolver
+            return get_neighbour_resolver().get_neighbour(self, 'East')
+        # explicit latitude window: scan the adjacent orbit
         cur_lat = self.get_sat_lat_degrees()
 
         routing_sat_list = []
-        for routing_sat_obj in sat_object_list[min_satnum:max_satnum]:
+        for routing_sat_obj in sat_registry.get_orbit(self.orbit_number_East):
             sat_lat = routing_sat_obj.get_sat_lat_degrees()
             if ((cur_lat - _lat_range) < sat_lat) and (sat_lat < (cur_lat + _lat_range)):
                 routing_sat_list.append(routing_sat_obj)
@@ -106,14 +180,14 @@ class routing_sat:
             
         return closest_sat_East
 
-    def get_sat_West(self, _lat_range = lat_range):
-        #range of satnums for target orbit
-        min_satnum = self.orbit_number_West * sats_per_orbit
-        max_satnum = min_satnum + sats_per_orbit
+    def get_sat_West(self, _lat_range = None):
+        if _lat_range is None: # argument-of-latitude neighbour from the per-snapshot resolver
+            return get_neighbour_resolver().get_neighbour(self, 'West')
+        # explicit latitude window: scan the adjacent orbit
         cur_lat = self.get_sat_lat_degrees()
 
         routing_sat_list = []
-        for routing_sat_obj in sat_object_list[min_satnum:max_satnum]:
+        for routing_sat_obj in sat_registry.get_orbit(self.orbit_number_West):
             sat_lat = routing_sat_obj.get_sat_lat_degrees()
             if ((cur_lat - _lat_range) < sat_lat) and (sat_lat < (cur_lat + _lat_range)):
                 routing_sat_list.append(routing_sat_obj)
@@ -131,81 +205,762 @@ class routing_sat:
         return closest_sat_West
 
     def get_sat_North(self):
-        first_target_satnum = self.satnum - 1
-        second_target_satnum = self.satnum + 1
-        first_target_orbit_number = floor(first_target_satnum / sats_per_orbit)
-        second_target_orbit_number = floor(second_target_satnum / sats_per_orbit)
-        if first_target_orbit_number != self.orbit_number:
-            first_target_satnum = (self.orbit_number * sats_per_orbit) + (first_target_satnum % sats_per_orbit)
-        if second_target_orbit_number != self.orbit_number:
-            second_target_satnum = (self.orbit_number * sats_per_orbit) + (second_target_orbit_number % sats_per_orbit)
-        self_lat, _ = wgs84.latlon_of(self.sat.at(cur_time))
-        first_target_routing_sat = get_routing_sat_obj_by_satnum(first_target_satnum)
-        first_target_lat, _ = wgs84.latlon_of(first_target_routing_sat.sat.at(cur_time))
-        second_target_routing_sat = get_routing_sat_obj_by_satnum(second_target_satnum)
-        second_target_lat, _ = wgs84.latlon_of(second_target_routing_sat.sat.at(cur_time))
-        if first_target_lat.degrees > second_target_lat.degrees:  # test which satellite is Northernmost
-            target_satnum = first_target_satnum
+        # the two in-plane neighbours; whichever is Northernmost is the candidate
+        first_target_routing_sat = sat_registry.get_by_slot(self.orbit_number, self.sat_index_North)
+        second_target_routing_sat = sat_registry.get_by_slot(self.orbit_number, self.sat_index_South)
+        if first_target_routing_sat is None: # a neighbour slot may be empty after a satellite is removed
+            first_target_routing_sat = second_target_routing_sat
+        if second_target_routing_sat is None:
+            second_target_routing_sat = first_target_routing_sat
+        if first_target_routing_sat is None:
+            return None
+        snapshot = get_constellation_snapshot()
+        self_lat = snapshot.get_lat_degrees(self.satnum)
+        first_target_lat = snapshot.get_lat_degrees(first_target_routing_sat.satnum)
+        second_target_lat = snapshot.get_lat_degrees(second_target_routing_sat.satnum)
+        if first_target_lat > second_target_lat:  # test which satellite is Northernmost
+            target_routing_sat = first_target_routing_sat
             target_lat = first_target_lat
         else:
-            target_satnum = second_target_satnum
+            target_routing_sat = second_target_routing_sat
             target_lat = second_target_lat
-        if target_lat.degrees < self_lat.degrees:
+        if target_lat < self_lat:
 
             return None
-        return sat_object_list[target_satnum]
+        return target_routing_sat
 
     def get_sat_South(self):
-        first_target_satnum = self.satnum - 1
-        second_target_satnum = self.satnum + 1
-        first_target_orbit_number = floor(first_target_satnum / sats_per_orbit)
-        second_target_orbit_number = floor(second_target_satnum / sats_per_orbit)
-        if first_target_orbit_number != self.orbit_number:
-            first_target_satnum = (self.orbit_number * sats_per_orbit) + (first_target_satnum % sats_per_orbit)
-        if second_target_orbit_number != self.orbit_number:
-            second_target_satnum = (self.orbit_number * sats_per_orbit) + (second_target_orbit_number % sats_per_orbit)
-        self_lat, _ = wgs84.latlon_of(self.sat.at(cur_time))
-        first_target_routing_sat = get_routing_sat_obj_by_satnum(first_target_satnum)
-        first_target_lat, _ = wgs84.latlon_of(first_target_routing_sat.sat.at(cur_time))
-        second_target_routing_sat = get_routing_sat_obj_by_satnum(second_target_satnum)
-        second_target_lat, _ = wgs84.latlon_of(second_target_routing_sat.sat.at(cur_time))
-        if first_target_lat.degrees < second_target_lat.degrees:  # test which satellite is Southernmost
-            target_satnum = first_target_satnum
+        # the two in-plane neighbours; whichever is Southernmost is the candidate
+        first_target_routing_sat = sat_registry.get_by_slot(self.orbit_number, self.sat_index_North)
+        second_target_routing_sat = sat_registry.get_by_slot(self.orbit_number, self.sat_index_South)
+        if first_target_routing_sat is None: # a neighbour slot may be empty after a satellite is removed
+            first_target_routing_sat = second_target_routing_sat
+        if second_target_routing_sat is None:
+            second_target_routing_sat = first_target_routing_sat
+        if first_target_routing_sat is None:
+            return None
+        snapshot = get_constellation_snapshot()
+        self_lat = snapshot.get_lat_degrees(self.satnum)
+        first_target_lat = snapshot.get_lat_degrees(first_target_routing_sat.satnum)
+        second_target_lat = snapshot.get_lat_degrees(second_target_routing_sat.satnum)
+        if first_target_lat < second_target_lat:  # test which satellite is Southernmost
+            target_routing_sat = first_target_routing_sat
             target_lat = first_target_lat
         else:
-            target_satnum = second_target_satnum
+            target_routing_sat = second_target_routing_sat
             target_lat = second_target_lat
-        if target_lat.degrees > self_lat.degrees:
+        if target_lat > self_lat:
             return None
-        return sat_object_list[target_satnum]
+        return target_routing_sat
 # End Routing sat class
 
+## :: Constellation Registry ::
+# Keeps sat_object_list and its lookup indexes consistent as satellites are added or removed
+class constellation_registry:
+    def __init__(self, sat_list):
+        self.sat_list = sat_list # routing_sat objects; list position is the row used by the propagator
+        self.by_satnum = {}
+        self.by_slot = {} # (orbit_number, sat_index) -> routing_sat
+        self.by_name = {}
+        self.orbits = {} # orbit_number -> {sat_index: routing_sat}
+        self.version = 0 # bumped on every change so dependent caches know to rebuild
+        self.satnum_rows = None # lazily built array, satnum -> row (-1 for gaps in the catalog)
+        self.slot_arrays = None # lazily built per-row plane/neighbour-slot arrays for vectorized neighbour resolution
+        self.file_records = None # constellation_records whose rows are exactly sat_list, set by load_constellation
+        for r_sat in list(sat_list):
+            self._index(r_sat)
+
+    def __len__(self):
+        return len(self.sat_list)
+
+    def __iter__(self):
+        return iter(self.sat_list)
+
+    def _index(self, r_sat):
+        self.by_satnum[r_sat.satnum] = r_sat
+        self.by_slot[(r_sat.orbit_number, r_sat.sat_index)] = r_sat
+        self.orbits.setdefault(r_sat.orbit_number, {})[r_sat.sat_index] = r_sat
+        name = r_sat.get_name()
+        if name is not None:
+            self.by_name[name] = r_sat
+
+    def add(self, r_sat):
+        self.extend([r_sat])
+
+    def extend(self, r_sats, file_records=None): # file_records: the loaded file r_sats were made from, row for row
+        for r_sat in r_sats:
+            if r_sat.satnum in self.by_satnum:
+                self.remove(r_sat.satnum)
+            self.sat_list.append(r_sat)
+            self._index(r_sat)
+        self.version += 1
+        self.satnum_rows = None
+        self.slot_arrays = None
+        self.file_records = file_records if len(self.sat_list) == len(r_sats) else None
+
+    def remove(self, satnum):
+        r_sat = self.by_satnum.pop(satnum, None)
+        if r_sat is None:
+            return None
+        self.sat_list.remove(r_sat)
+        self.by_slot.pop((r_sat.orbit_number, r_sat.sat_index), None)
+        orbit = self.orbits.get(r_sat.orbit_number)
+        if orbit is not None:
+            orbit.pop(r_sat.sat_index, None)
+            if len(orbit) == 0:
+                del self.orbits[r_sat.orbit_number]
+        name = r_sat.get_name()
+        if (name is not None) and (self.by_name.get(name) is r_sat):
+            del self.by_name[name]
+        self.version += 1
+        self.satnum_rows = None
+        self.slot_arrays = None
+        self.file_records = None
+        return r_sat
+
+    def clear(self):
+        del self.sat_list[:] # keep the same list object, it is also the module-level sat_object_list
+        self.by_satnum.clear()
+        self.by_slot.clear()
+        self.by_name.clear()
+        self.orbits.clear()
+        self.version += 1
+        self.satnum_rows = None
+        self.slot_arrays = None
+        self.file_records = None
+
+    def get_by_satnum(self, satnum):
+        return self.by_satnum.get(satnum)
+
+    def get_by_slot(self, orbit_number, sat_index):
+        return self.by_slot.get((orbit_number, sat_index))
+
+    def get_by_name(self, name):
+        return self.by_name.get(name)
+
+    def get_orbit(self, orbit_number): # satellites of one orbital plane ordered by sat_index
+        orbit = self.orbits.get(orbit_number, {})
+        return [orbit[sat_index] for sat_index in sorted(orbit)]
+
+    def get_satnum_rows(self):
+        if self.satnum_rows is None:
+            max_satnum = max(self.by_satnum) if len(self.by_satnum) > 0 else -1
+            self.satnum_rows = np.full(max_satnum + 1, -1, dtype=np.int64)
+            for row, r_sat in enumerate(self.sat_list):
+                self.satnum_rows[r_sat.satnum] = row
+        return self.satnum_rows
+
+    def get_slot_arrays(self): # (orbit_number, orbit_number_East, orbit_number_West, North slot row, South slot row) per row
+        if self.slot_arrays is None:
+            row_of = {r_sat.satnum: row for row, r_sat in enumerate(self.sat_list)}
+            def slot_row(orbit_number, sat_index):
+                r_sat = self.by_slot.get((orbit_number, sat_index))
+                return -1 if r_sat is None else row_of[r_sat.satnum]
+            self.slot_arrays = (
+                np.array([r_sat.orbit_number for r_sat in self.sat_list], dtype=np.int64),
+                np.array([r_sat.orbit_number_East for r_sat in self.sat_list], dtype=np.int64),
+                np.array([r_sat.orbit_number_West for r_sat in self.sat_list], dtype=np.int64),
+                np.array([slot_row(r_sat.orbit_number, r_sat.sat_index_North) for r_sat in self.sat_list], dtype=np.int64),
+                np.array([slot_row(r_sat.orbit_number, r_sat.sat_index_South) for r_sat in self.sat_list], dtype=np.int64))
+        return self.slot_arrays
+
+sat_registry = constellation_registry(sat_object_list)
+
+## :: Batch Propagation ::
+# Propagates the whole constellation with one SatrecArray call instead of one EarthSatellite.at() per satellite
+class constellation_state:
+    def __init__(self, t, satnum_index, teme_r, teme_v, itrs_r, itrs_v, errors):
+        self.t = t
+        self.satnum_index = satnum_index # satnum -> row in the position/velocity arrays
+        self.teme_r = teme_r # km, (N, 3) for a single time or (T, N, 3) for a time array
+        self.teme_v = teme_v # km/s
+        self.itrs_r = itrs_r # km, Earth-fixed
+        self.itrs_v = itrs_v # km/s, Earth-fixed
+        self.errors = errors # SGP4 error codes, 0 when propagation succeeded
+
+    def get_row(self, satnum):
+        return self.satnum_index[satnum]
+
+    def get_position_km(self, satnum, frame='itrs'):
+        row = self.satnum_index[satnum]
+        if frame == 'teme':
+            return self.teme_r[..., row, :]
+        return self.itrs_r[..., row, :]
+
+    def get_velocity_km_per_s(self, satnum, frame='itrs'):
+        row = self.satnum_index[satnum]
+        if frame == 'teme':
+            return self.teme_v[..., row, :]
+        return self.itrs_v[..., row, :]
+
+    def get_distance_km(self, satnum1, satnum2):
+        diff = self.itrs_r[..., self.satnum_index[satnum1], :] - self.itrs_r[..., self.satnum_index[satnum2], :]
+        return np.sqrt((diff * diff).sum(axis=-1))
+
+class constellation_propagator:
+    def __init__(self, satrec_list, satnums=None): # satnums: per-row catalog numbers when already known, e.g. a record column
+        self.satrec_list = list(satrec_list)
+        if satnums is None:
+            satnums = [satrec.satnum for satrec in self.satrec_list]
+        self.satnums = np.asarray(satnums, dtype=np.int64)
+        self.satnum_index = {satnum: row for row, satnum in enumerate(self.satnums.tolist())}
+        self.satrec_array = SatrecArray(self.satrec_list)
+        self.last_time_key = None
+        self.last_state = None
+
+    def propagate(self, t): # t is a skyfield Time, either a single instant or an array of instants
+        single_time = (np.ndim(t.whole) == 0)
+        whole, fraction, ut1_fraction = get_sgp4_time_split(t)
+
+        errors, r, v = self.satrec_array.sgp4(whole, fraction) # SatrecArray returns (N, T, 3)
+        teme_r = np.ascontiguousarray(r.transpose(1, 0, 2)) # (T, N, 3), one (N, 3) block per timestep
+        teme_v = np.ascontiguousarray(v.transpose(1, 0, 2))
+        errors = np.ascontiguousarray(errors.T)
+        itrs_r, itrs_v = teme_to_itrs(teme_r, teme_v, whole, ut1_fraction)
+
+        if single_time:
+            teme_r, teme_v, itrs_r, itrs_v, errors = teme_r[0], teme_v[0], itrs_r[0], itrs_v[0], errors[0]
+        return constellation_state(t, self.satnum_index, teme_r, teme_v, itrs_r, itrs_v, errors)
+
+    def at(self, t): # single instant; repeated calls for the same time reuse the last propagation
+        time_key = (float(t.whole), float(t.tai_fraction))
+        if time_key != self.last_time_key:
+            self.last_state = self.propagate(t)
+            self.last_time_key = time_key
+        return self.last_state
+
+## :: Constellation Snapshots ::
+# Geodetic latitude/longitude/height of every satellite, computed once per cur_time
+class constellation_snapshot:
+    def __init__(self, state, geodetic=None, arg_lat=None): # geodetic (lat, lon, height) and arg_lat may be sliced from a batch
+        self.state = state
+        self.t = state.t
+        self.satnum_index = state.satnum_index
+        if geodetic is None:
+            geodetic = itrs_to_geodetic(state.itrs_r)
+        self.lat_degrees, self.lon_degrees, self.height_km = geodetic
+        self.arg_lat = arg_lat # argument of latitude in degrees, computed by the neighbour resolver when not given
+        self.topology = None # topology_snapshot, built on first routing request for this time
+        self.spatial_index = None # satellite_spatial_index, built on first ground lookup for this time
+        self.neighbour_resolver = None # neighbour_resolver, built on first neighbour lookup for this time
+
+    def get_lat_degrees(self, satnum):
+        return float(self.lat_degrees[self.satnum_index[satnum]])
+
+    def get_lon_degrees(self, satnum):
+        return float(self.lon_degrees[self.satnum_index[satnum]])
+
+    def get_height_km(self, satnum):
+        return float(self.height_km[self.satnum_index[satnum]])
+
+class snapshot_cache: # bounded LRU of recent snapshots keyed by time
+    def __init__(self, max_size=snapshot_cache_size):
+        self.max_size = max_size
+        self.snapshots = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, t, propagator):
+        time_key = get_time_key(t)
+        snapshot = self.snapshots.get(time_key)
+        if snapshot is not None:
+            self.snapshots.move_to_end(time_key)
+            self.hits += 1
+            return snapshot
+        self.misses += 1
+        snapshot = constellation_snapshot(propagator.propagate(t))
+        self.put(snapshot)
+        return snapshot
+
+    def put(self, snapshot): # insert a snapshot built elsewhere, e.g. from a batch propagation
+        self.snapshots[get_time_key(snapshot.t)] = snapshot
+        self.snapshots.move_to_end(get_time_key(snapshot.t))
+        if len(self.snapshots) > self.max_size:
+            self.snapshots.popitem(last=False) # drop least recently used
+
+    def invalidate(self, t=None): # drop one time, or everything when t is None (e.g. the constellation changed)
+        if t is None:
+            self.snapshots.clear()
+        else:
+            self.snapshots.pop(get_time_key(t), None)
+
+sat_snapshot_cache = snapshot_cache()
+
+def get_time_key(t):
+    return (float(t.whole), float(t.tai_fraction))
+
+def itrs_to_geodetic(itrs_r): # vectorized version of skyfield's wgs84 latitude iteration; returns degrees, degrees, km
+    x = itrs_r[..., 0]
+    y = itrs_r[..., 1]
+    z = itrs_r[..., 2]
+    R = np.sqrt(x*x + y*y)
+    lat = np.arctan2(z, R)
+    for _ in range(3):
+        sin_lat = np.sin(lat)
+        e2_sin_lat = wgs84_e2 * sin_lat
+        aC = wgs84_radius_km / np.sqrt(1.0 - e2_sin_lat * sin_lat)
+        hyp = z + aC * e2_sin_lat
+        lat = np.arctan2(hyp, R)
+    lon = (np.arctan2(y, x) - pi) % (2*pi) - pi
+    height = np.sqrt(hyp*hyp + R*R) - aC
+    return np.degrees(lat), np.degrees(lon), height
+
+def get_propagator():
+    global sat_propagator, sat_propagator_version
+    if (sat_propagator is None) or (sat_propagator_version != sat_registry.version):
+        file_records = sat_registry.file_records
+        if file_records is not None: # straight from the loaded record columns, no per-satellite lookups
+            sat_propagator = constellation_propagator(file_records.get_satrecs(), file_records.records['satnum'])
+        else:
+            sat_propagator = constellation_propagator([r_sat.get_satrec() for r_sat in sat_registry])
+        sat_propagator_version = sat_registry.version
+        sat_snapshot_cache.invalidate()
+        invalidate_constellation_snapshot()
+    return sat_propagator
+
+def get_constellation_snapshot():
+    global cur_snapshot
+    get_propagator() # rebuilds and drops stale snapshots if the constellation changed
+    if (cur_snapshot is None) or (get_time_key(cur_snapshot.t) != get_time_key(cur_time)):
+        cur_snapshot = sat_snapshot_cache.get(cur_time, get_propagator())
+    return cur_snapshot
+
+def invalidate_constellation_snapshot():
+    global cur_snapshot
+    cur_snapshot = None
+
+def set_cur_time(t):
+    global cur_time
+    cur_time = t
+    invalidate_constellation_snapshot() # cached snapshots for other times stay in sat_snapshot_cache
+
+def get_constellation_state():
+    return get_constellation_snapshot().state
+
+def get_sgp4_time_split(t): # (whole, utc fraction, ut1 fraction) arrays for a skyfield Time
+    whole = np.atleast_1d(t.whole).astype(np.float64)
+    # same UTC day split EarthSatellite uses, so results match sat.at(t); TAI - UTC comes from the public calendar
+    # components and is a whole number of seconds (only inside a leap second itself does skyfield's own split differ)
+    leap_seconds = np.round((t.tai - julian_date(*t.utc)) * DAY_S)
+    fraction = np.atleast_1d(t.tai_fraction - leap_seconds / DAY_S).astype(np.float64)
+    ut1_fraction = np.atleast_1d(t.ut1_fraction).astype(np.float64)
+    return whole, fraction, ut1_fraction
+
+def teme_to_itrs(teme_r, teme_v, whole, ut1_fraction): # (T, N, 3) TEME km and km/s -> ITRS, one GMST angle per timestep
+    # TEME -> ITRS is a single rotation about z by GMST (polar motion ignored, as skyfield does by default)
+    theta, theta_dot = theta_GMST1982(whole, ut1_fraction)
+    cos_theta = np.cos(theta)[:, np.newaxis]
+    sin_theta = np.sin(theta)[:, np.newaxis]
+    omega = (theta_dot / DAY_S)[:, np.newaxis] # Earth rotation rate in rad/s
+    itrs_r = np.empty_like(teme_r)
+    itrs_r[..., 0] = cos_theta * teme_r[..., 0] + sin_theta * teme_r[..., 1]
+    itrs_r[..., 1] = -sin_theta * teme_r[..., 0] + cos_theta * teme_r[..., 1]
+    itrs_r[..., 2] = teme_r[..., 2]
+    itrs_v = np.empty_like(teme_v)
+    itrs_v[..., 0] = cos_theta * teme_v[..., 0] + sin_theta * teme_v[..., 1] + omega * itrs_r[..., 1]
+    itrs_v[..., 1] = -sin_theta * teme_v[..., 0] + cos_theta * teme_v[..., 1] - omega * itrs_r[..., 0]
+    itrs_v[..., 2] = teme_v[..., 2]
+    return itrs_r, itrs_v
+
+def get_lat_lon_degrees_of(target): # routing_sat, ground station (GeographicPosition), or anything with .at()
+    if isinstance(target, routing_sat):
+        return target.get_sat_lat_degrees(), target.get_sat_lon_degrees()
+    if hasattr(target, 'latitude') and hasattr(target, 'longitude'):
+        return target.latitude.degrees, target.longitude.degrees
+    lat, lon = wgs84.latlon_of(target.at(cur_time))
+    return lat.degrees, lon.degrees
+
+def get_routing_sat_distance(routing_sat1, routing_sat2): # returns distance between routing satellites in km at cur_time
+    return float(get_constellation_state().get_distance_km(routing_sat1.satnum, routing_sat2.satnum))
+
+## :: Neighbour Resolver ::
+# N/S/E/W neighbours of the whole constellation in one vectorized pass. Cross-plane neighbours are matched by argument
+# of latitude, which unlike plain latitude tells an ascending satellite apart from a descending one at the same latitude
+neighbour_directions = ('North', 'South', 'East', 'West')
+
+class neighbour_resolver:
+    def __init__(self, snapshot):
+        state = snapshot.state
+        orbit_number, orbit_East, orbit_West, north_slot_row, south_slot_row = sat_registry.get_slot_arrays()
+        num_sats = len(orbit_number)
+        rows = np.arange(num_sats)
+        lat = snapshot.lat_degrees
+        positions = state.itrs_r
+        self.snapshot = snapshot
+        if snapshot.arg_lat is None:
+            snapshot.arg_lat = get_argument_of_latitude_degrees(state.teme_r, state.teme_v)
+        self.arg_lat = snapshot.arg_lat
+        self.satnums = np.fromiter(state.satnum_index, dtype=np.int64, count=num_sats) # satnum_index is built in row order
+
+        # in-plane: of the two slot neighbours, the more Northern (Southern) one, if it is actually further North (South)
+        first = np.where(north_slot_row < 0, south_slot_row, north_slot_row)
+        second = np.where(south_slot_row < 0, north_slot_row, south_slot_row)
+        has_slot = first >= 0
+        first_lat = np.where(has_slot, lat[first], np.nan)
+        second_lat = np.where(has_slot, lat[second], np.nan)
+        north = np.where(first_lat > second_lat, first, second)
+        north = np.where(has_slot & (lat[north] >= lat), north, -1)
+        south = np.where(first_lat < second_lat, first, second)
+        south = np.where(has_slot & (lat[south] <= lat), south, -1)
+
+        # cross-plane: binary search each satellite's argument of latitude in the adjacent plane's sorted list
+        order = np.lexsort((self.arg_lat, orbit_number))
+        sorted_key = orbit_number[order] * 360.0 + self.arg_lat[order]
+        sorted_orbit = orbit_number[order]
+        east_west = []
+        for target_orbit in (orbit_East, orbit_West):
+            plane_start = np.searchsorted(sorted_orbit, target_orbit, side='left')
+            plane_end = np.searchsorted(sorted_orbit, target_orbit, side='right')
+            plane_size = plane_end - plane_start
+            position = np.searchsorted(sorted_key, target_orbit * 360.0 + self.arg_lat)
+            above = order[np.where(position < plane_end, position, plane_start) % max(num_sats, 1)] # wraps past 360 degrees
+            below = order[np.where(position - 1 >= plane_start, position - 1, plane_end - 1) % max(num_sats, 1)]
+            # tie-break between the two bracketing satellites on straight-line distance
+            above_diff = positions[above] - positions
+            below_diff = positions[below] - positions
+            closest = np.where((above_diff * above_diff).sum(axis=1) <= (below_diff * below_diff).sum(axis=1), above, below)
+            phase_offset = np.abs((self.arg_lat[closest] - self.arg_lat + 180.0) % 360.0 - 180.0)
+            valid = (plane_size > 0) & (phase_offset <= 360.0 / np.maximum(plane_size, 1)) & (closest != rows)
+            east_west.append(np.where(valid, closest, -1))
+
+        self.neighbour_rows = np.stack((north, south, east_west[0], east_west[1]), axis=1) # (N, 4), -1 for no neighbour
+
+    def get_neighbour(self, r_sat, direction): # routing_sat in the given direction, None if there is none
+        neighbour_row = self.neighbour_rows[self.snapshot.state.get_row(r_sat.satnum), neighbour_directions.index(direction)]
+        if neighbour_row < 0:
+            return None
+        return sat_registry.get_by_satnum(int(self.satnums[neighbour_row]))
+
+def get_argument_of_latitude_degrees(r, v): # angle from the ascending node along the orbit, [0, 360), from TEME r and v
+    h = np.cross(r, v)
+    node = np.stack((-h[..., 1], h[..., 0], np.zeros(h.shape[:-1])), axis=-1) # z x h points at the ascending node
+    node /= np.sqrt((node * node).sum(axis=-1))[..., np.newaxis]
+    h /= np.sqrt((h * h).sum(axis=-1))[..., np.newaxis]
+    in_plane = np.cross(h, node) # 90 degrees ahead of the node, in the orbit plane
+    return np.degrees(np.arctan2((r * in_plane).sum(axis=-1), (r * node).sum(axis=-1))) % 360.0
+
+def get_neighbour_resolver(): # cached on the constellation snapshot for cur_time
+    snapshot = get_constellation_snapshot()
+    if snapshot.neighbour_resolver is None:
+        snapshot.neighbour_resolver = neighbour_resolver(snapshot)
+    return snapshot.neighbour_resolver
+
+## :: Spatial Index ::
+# KD-tree over Earth-fixed satellite positions for ground station and nearest-satellite lookups
+class satellite_spatial_index:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.positions_km = snapshot.state.itrs_r
+        self.satnums = np.empty(len(snapshot.satnum_index), dtype=np.int64)
+        for satnum, row in snapshot.satnum_index.items():
+            self.satnums[row] = satnum
+        self.max_radius_km = float(np.sqrt((self.positions_km * self.positions_km).sum(axis=1)).max())
+        self.tree = cKDTree(self.positions_km)
+
+    def get_look_angles(self, location, rows): # (elevation degrees, azimuth degrees, slant range km) from a ground location
+        lat = location.latitude.radians
+        lon = location.longitude.radians
+        up = np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+        east = np.array([-np.sin(lon), np.cos(lon), 0.0])
+        north = np.cross(up, east)
+        diff = self.positions_km[rows] - location.itrs_xyz.km
+        slant_range = np.sqrt((diff * diff).sum(axis=-1))
+        elevation = np.degrees(np.arcsin(diff.dot(up) / slant_range))
+        azimuth = np.degrees(np.arctan2(diff.dot(east), diff.dot(north))) % 360.0
+        return elevation, azimuth, slant_range
+
+    def get_elevations(self, location, rows): # degrees above the horizon of a ground location, for the given rows
+        return self.get_look_angles(location, rows)[0]
+
+    def get_elevation_of(self, location, satnum):
+        return float(self.get_elevations(location, self.snapshot.satnum_index[satnum]))
+
+    def get_closest_row(self, row, candidate_rows): # the candidate nearest to the satellite in row, straight-line
+        diff = self.positions_km[candidate_rows] - self.positions_km[row]
+        return candidate_rows[int(np.argmin((diff * diff).sum(axis=1)))]
+
+    def query_elevation_cone(self, location, min_elev=req_elev): # (satnums, elevations) above min_elev, highest first
+        ground_km = location.itrs_xyz.km
+        ground_radius = np.sqrt(ground_km.dot(ground_km))
+        # longest slant range at which a satellite at the highest shell altitude can still be min_elev above the horizon
+        sin_elev = np.sin(np.radians(min_elev))
+        max_range = -ground_radius * sin_elev + np.sqrt((ground_radius * sin_elev) ** 2 + self.max_radius_km ** 2 - ground_radius ** 2)
+        rows = np.array(self.tree.query_ball_point(ground_km, max_range * 1.01 + 10.0), dtype=np.int64) # margin for the ellipsoid
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        elevations = self.get_elevations(location, rows)
+        keep = elevations > min_elev
+        rows = rows[keep]
+        elevations = elevations[keep]
+        order = np.argsort(-elevations)
+        return self.satnums[rows[order]], elevations[order]
+
+    def query_nearest(self, point, k=1): # (satnums, distances km) of the k satellites nearest a ground location or ITRS point in km
+        point_km = point.itrs_xyz.km if hasattr(point, 'itrs_xyz') else np.asarray(point, dtype=np.float64)
+        distances, rows = self.tree.query(point_km, k=k)
+        return self.satnums[np.atleast_1d(rows)], np.atleast_1d(distances)
+
+    def get_best_overhead_satnum(self, location, min_elev=req_elev): # satnum with the highest elevation, None if nothing clears min_elev
+        satnums, _ = self.query_elevation_cone(location, min_elev)
+        if len(satnums) == 0:
+            return None
+        return int(satnums[0])
+
+def get_spatial_index(snapshot=None): # cached on the constellation snapshot, by default the one for cur_time
+    if snapshot is None:
+        snapshot = get_constellation_snapshot()
+    if snapshot.spatial_index is None:
+        snapshot.spatial_index = satellite_spatial_index(snapshot)
+    return snapshot.spatial_index
+
+## :: Ground Station Access Windows ::
+# Rise/set/peak of every satellite over every ground station, found on a coarse grid and refined by root-finding
+access_window_dtype = np.dtype([('station', np.int32), ('satnum', np.int64), ('rise', np.float64), ('set', np.float64), ('peak_time', np.float64), ('peak_elev', np.float32)])
+
+class access_window_table:
+    def __init__(self, windows, locations, start_time, duration_seconds, min_elev):
+        self.windows = windows # access_window_dtype records sorted by station then rise; times in seconds after start_time
+        self.locations = locations
+        self.start_time = start_time
+        self.duration_seconds = duration_seconds
+        self.min_elev = min_elev
+        self.station_bounds = np.searchsorted(windows['station'], np.arange(len(locations) + 1))
+        self.max_window_seconds = float((windows['set'] - windows['rise']).max()) if len(windows) > 0 else 0.0
+
+    def get_station_index(self, location): # None if the location is not one of the table's stations
+        for station_index, station in enumerate(self.locations):
+            if (station is location) or ((station.latitude.degrees == location.latitude.degrees) and (station.longitude.degrees == location.longitude.degrees)):
+                return station_index
+        return None
+
+    def get_seconds(self, t):
+        return float((t - self.start_time) * DAY_S)
+
+    def covers(self, t):
+        return 0.0 <= self.get_seconds(t) <= self.duration_seconds
+
+    def get_visible_windows(self, station_index, seconds): # windows of one station open at the given offset
+        station_windows = self.windows[self.station_bounds[station_index]:self.station_bounds[station_index+1]]
+        # only windows that rose within the longest window length can still be open
+        first = np.searchsorted(station_windows['rise'], seconds - self.max_window_seconds, side='left')
+        last = np.searchsorted(station_windows['rise'], seconds, side='right')
+        candidates = station_windows[first:last]
+        return candidates[candidates['set'] > seconds]
+
+    def get_ingress_satnum(self, location, t=None): # satellite that stays visible the longest from t, None if nothing is up
+        station_index = self.get_station_index(location)
+        if station_index is None:
+            return None
+        if t is None:
+            t = cur_time
+        seconds = self.get_seconds(t)
+        visible = self.get_visible_windows(station_index, seconds)
+        if len(visible) == 0:
+            return None
+        return int(visible['satnum'][np.argmax(visible['set'])])
+
+def get_station_vectors(locations): # (ITRS position km, local up unit vector) per ground location, each (S, 3)
+    ground_km = np.array([location.itrs_xyz.km for location in locations], dtype=np.float64).reshape(-1, 3)
+    lat = np.array([location.latitude.radians for location in locations])
+    lon = np.array([location.longitude.radians for location in locations])
+    up = np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1).reshape(-1, 3)
+    return ground_km, up
+
+def get_elevation_degrees(positions_km, ground_km, up): # broadcasts over leading axes, last axis is xyz
+    diff = positions_km - ground_km
+    slant_range = np.sqrt((diff * diff).sum(axis=-1))
+    return np.degrees(np.arcsin((diff * up).sum(axis=-1) / slant_range))
+
+def get_crossing_elevations(satrec_list, sat_rows, seconds, ground_km, up, start_time): # exact elevation per crossing estimate
+    times = start_time + seconds / DAY_S
+    whole, fraction, ut1_fraction = get_sgp4_time_split(times)
+    r = np.empty((len(sat_rows), 3))
+    v = np.empty((len(sat_rows), 3))
+    order = np.argsort(sat_rows, kind='stable')
+    bounds = np.flatnonzero(np.diff(sat_rows[order])) + 1
+    for group in np.split(order, bounds): # one sgp4_array call per satellite, covering all of its crossings
+        if len(group) == 0:
+            continue
+        _, r[group], v[group] = satrec_list[sat_rows[group[0]]].sgp4_array(whole[group], fraction[group])
+    itrs_r, _ = teme_to_itrs(r[:, np.newaxis, :], v[:, np.newaxis, :], whole, ut1_fraction) # one GMST angle per crossing
+    return get_elevation_degrees(itrs_r[:, 0, :], ground_km, up)
+
+def refine_crossings(satrec_list, sat_rows, t_lo, t_hi, e_lo, e_hi, ground_km, up, start_time, min_elev):
+    # Illinois regula falsi on elevation - min_elev, which changes sign inside every [t_lo, t_hi] bracket
+    t_new = t_lo.copy()
+    e_new = e_lo.copy()
+    last_side = np.zeros(len(t_lo), dtype=np.int8) # side replaced on the previous iteration, -1 lo / +1 hi
+    for _ in range(access_refine_iterations):
+        t_new = t_lo + (t_hi - t_lo) * (e_lo / (e_lo - e_hi))
+        e_new = get_crossing_elevations(satrec_list, sat_rows, t_new, ground_km, up, start_time) - min_elev
+        keep_lo = np.sign(e_new) != np.sign(e_lo) # root lies between t_lo and t_new
+        # halve the stale endpoint when the same side is replaced twice in a row, so convergence stays superlinear
+        e_lo = np.where(keep_lo & (last_side == 1), e_lo / 2, e_lo)
+        e_hi = np.where((~keep_lo) & (last_side == -1), e_hi / 2, e_hi)
+        t_hi = np.where(keep_lo, t_new, t_hi)
+        e_hi = np.where(keep_lo, e_new, e_hi)
+        t_lo = np.where(keep_lo, t_lo, t_new)
+        e_lo = np.where(keep_lo, e_lo, e_new)
+        last_side = np.where(keep_lo, 1, -1).astype(np.int8)
+    return t_new
+
+def refine_peaks(satrec_list, sat_rows, t_lo, t_hi, ground_km, up, start_time): # golden-section search; (peak seconds, peak elevation)
+    ratio = (np.sqrt(5.0) - 1) / 2
+    t_c = t_hi - ratio * (t_hi - t_lo)
+    t_d = t_lo + ratio * (t_hi - t_lo)
+    e_c = get_crossing_elevations(satrec_list, sat_rows, t_c, ground_km, up, start_time)
+    e_d = get_crossing_elevations(satrec_list, sat_rows, t_d, ground_km, up, start_time)
+    for _ in range(access_peak_iterations):
+        left = e_c > e_d # the peak lies in [t_lo, t_d]
+        t_hi = np.where(left, t_d, t_hi)
+        t_lo = np.where(left, t_lo, t_c)
+        t_new = np.where(left, t_hi - ratio * (t_hi - t_lo), t_lo + ratio * (t_hi - t_lo))
+        e_new = get_crossing_elevations(satrec_list, sat_rows, t_new, ground_km, up, start_time)
+        t_c, e_c, t_d, e_d = np.where(left, t_new, t_d), np.where(left, e_new, e_d), np.where(left, t_c, t_new), np.where(left, e_c, e_new)
+    return np.where(e_c > e_d, t_c, t_d), np.maximum(e_c, e_d)
+
+def get_pass_edge_elevation(min_elev, seconds_from_peak, min_radius_km):
+    # lower bound on the elevation seconds_from_peak away from the peak of any pass that reaches min_elev: the worst case
+    # is a pass peaking exactly at min_elev, flown by the lowest satellite at its orbital rate plus the Earth's rotation
+    # (spherical Earth, so callers leave some margin)
+    ratio = wgs84_radius_km / min_radius_km
+    peak_elev = np.radians(min_elev)
+    peak_angle = np.arccos(ratio * np.cos(peak_elev)) - peak_elev # central angle from the station to the sub-satellite point
+    along_track = (np.sqrt(earth_mu_km3_s2 / min_radius_km ** 3) + earth_rotation_rad_s) * seconds_from_peak
+    angle = np.arccos(np.clip(np.cos(peak_angle) * np.cos(along_track), -1.0, 1.0))
+    return float(np.degrees(np.arctan2(np.cos(angle) - ratio, np.sin(angle))))
+
+def compute_access_windows(locations, start_time=None, duration_seconds=86400, step_seconds=access_step_seconds, min_elev=req_elev):
+    # Passes are found on a coarse grid at a lowered bracket elevation, so short passes that barely clear min_elev are
+    # not lost between samples. Inside each bracket the peak is found by golden-section search on exact SGP4 elevations,
+    # passes whose peak stays below min_elev are dropped, and rise / set are solved on either side of the peak
+    if start_time is None:
+        start_time = cur_time
+    start = time.time()
+    propagator = get_propagator()
+    satnums = propagator.satnums
+    num_sats = len(satnums)
+    num_steps = int(duration_seconds // step_seconds) + 1
+    offsets = np.arange(num_steps) * float(step_seconds)
+
+    # coarse grid: (N, T, 3) float32 ITRS positions, satellite-major so each satellite's track is contiguous
+    positions = np.empty((num_sats, num_steps, 3), dtype=np.float32)
+    for chunk_start in range(0, num_steps, access_chunk_steps):
+        chunk_offsets = offsets[chunk_start:chunk_start+access_chunk_steps]
+        state = propagator.propagate(start_time + chunk_offsets / DAY_S)
+        positions[:, chunk_start:chunk_start+len(chunk_offsets)] = state.itrs_r.transpose(1, 0, 2)
+
+    ground_km, up = get_station_vectors(locations)
+    flat_positions = positions.reshape(-1, 3)
+    radius_sq = (flat_positions.astype(np.float64) ** 2).sum(axis=1) # |r|^2, shared by every station
+    # every pass reaching min_elev stays above bracket_elev for 1.5 coarse steps, so a sample always lands inside it, and
+    # the sample nearest its peak (at most half a step away) is above candidate_elev; other brackets are dropped unrefined
+    min_radius_km = float(np.sqrt(radius_sq.min())) if len(radius_sq) > 0 else wgs84_radius_km + 1.0
+    bracket_elev = get_pass_edge_elevation(min_elev, 0.75 * step_seconds, min_radius_km)
+    candidate_elev = get_pass_edge_elevation(min_elev, 0.5 * step_seconds, min_radius_km)
+    bracket_station = []
+    bracket_sat_rows = []
+    bracket_lo = [] # coarse sample before the bracket (or the first sample, clipped)
+    bracket_hi = [] # coarse sample after the bracket (or the last sample, clipped)
+    bracket_e_lo = []
+    bracket_e_hi = []
+    for station_index in range(len(locations)):
+        # |r - g|^2 = |r|^2 - 2 r.g + |g|^2 and (r - g).up = r.up - g.up, so one (N*T, 3) x (3, 2) product per station
+        station_ground = ground_km[station_index]
+        station_up = up[station_index]
+        dots = flat_positions.dot(np.stack((station_up, station_ground), axis=1).astype(np.float32)).astype(np.float64)
+        slant_range = np.sqrt(radius_sq - 2 * dots[:, 1] + station_ground.dot(station_ground))
+        elev = np.degrees(np.arcsin((dots[:, 0] - station_ground.dot(station_up)) / slant_range)).reshape(num_sats, num_steps) # (N, T)
+        padded = np.zeros((num_sats, num_steps + 2), dtype=np.int8)
+        padded[:, 1:-1] = elev > bracket_elev
+        edges = np.diff(padded, axis=1)
+        rise_rows, rise_samples = np.nonzero(edges == 1) # bracket starts at this sample
+        _, set_samples = np.nonzero(edges == -1) # bracket ends before this sample; nonzero order pairs rises with sets
+        candidate_counts = np.zeros((num_sats, num_steps + 1), dtype=np.int32)
+        np.cumsum(elev > candidate_elev, axis=1, out=candidate_counts[:, 1:])
+        candidate = candidate_counts[rise_rows, set_samples] > candidate_counts[rise_rows, rise_samples]
+        rise_rows, rise_samples, set_samples = rise_rows[candidate], rise_samples[candidate], set_samples[candidate]
+        lo_samples = np.maximum(rise_samples - 1, 0)
+        hi_samples = np.minimum(set_samples, num_steps - 1)
+        bracket_station.append(np.full(len(rise_rows), station_index))
+        bracket_sat_rows.append(rise_rows)
+        bracket_lo.append(lo_samples)
+        bracket_hi.append(hi_samples)
+        bracket_e_lo.append(elev[rise_rows, lo_samples])
+        bracket_e_hi.append(elev[rise_rows, hi_samples])
+
+    records = []
+    bracket_sat_rows = np.concatenate(bracket_sat_rows) if bracket_sat_rows else np.empty(0, dtype=np.int64)
+    if len(bracket_sat_rows) > 0:
+        bracket_station = np.concatenate(bracket_station)
+        station_ground = ground_km[bracket_station]
+        station_up = up[bracket_station]
+        t_lo = offsets[np.concatenate(bracket_lo)]
+        t_hi = offsets[np.concatenate(bracket_hi)]
+        e_lo = np.concatenate(bracket_e_lo) - min_elev
+        e_hi = np.concatenate(bracket_e_hi) - min_elev
+        satrec_list = propagator.satrec_list
+        peak_seconds, peak_elev = refine_peaks(satrec_list, bracket_sat_rows, t_lo, t_hi, station_ground, station_up, start_time)
+        rise_seconds = t_lo.copy() # a pass already above min_elev at the start of the grid stays clipped there
+        set_seconds = t_hi.copy()
+        # rise between the bracket start and the peak, set between the peak and the bracket end
+        for seconds, edge_t, edge_e, rising in ((rise_seconds, t_lo, e_lo, True), (set_seconds, t_hi, e_hi, False)):
+            solve = np.flatnonzero((peak_elev > min_elev) & (edge_e < 0))
+            if len(solve) == 0:
+                continue
+            peak_t = peak_seconds[solve]
+            peak_e = peak_elev[solve] - min_elev
+            if rising:
+                bounds = (edge_t[solve], peak_t, edge_e[solve], peak_e)
+            else:
+                bounds = (peak_t, edge_t[solve], peak_e, edge_e[solve])
+            seconds[solve] = refine_crossings(satrec_list, bracket_sat_rows[solve], *bounds, station_ground[solve], station_up[solve], start_time, min_elev)
+        for index in np.flatnonzero(peak_elev > min_elev).tolist():
+            records.append((bracket_station[index], satnums[bracket_sat_rows[index]], rise_seconds[index], set_seconds[index], peak_seconds[index], peak_elev[index]))
+    windows = np.array(records, dtype=access_window_dtype)
+    windows = windows[np.lexsort((windows['rise'], windows['station']))]
+    print(f'Computed {len(windows)} access windows for {len(locations)} stations x {num_sats} satellites x {num_steps} steps in {time.time() - start:.2f} seconds')
+    return access_window_table(windows, list(locations), start_time, duration_seconds, min_elev)
+
 ## :: General Functions ::
 def get_routing_sat_obj_by_satnum(satnum):
-    if len(sat_object_list) < 1:
+    if len(sat_registry) < 1:
         return None
-    for routing_sat_obj in sat_object_list:
-        if routing_sat_obj.sat.model.satnum == satnum:
-            return routing_sat_obj
-    print(f'No satellite found for satnum: {satnum} - number of satellites: {len(sat_object_list)}')
-    return None
+    routing_sat_obj = sat_registry.get_by_satnum(satnum)
+    if routing_sat_obj is None:
+        print(f'No satellite found for satnum: {satnum} - number of satellites: {len(sat_registry)}')
+    return routing_sat_obj
 
 
 def find_closest_routing_satellite(cur_routing_sat, routing_sat_list):
-    closest_routing_sat = None
-    min_distance = float('inf') # Initialize minimum distance to infinity
-    
-    for r_s in routing_sat_list:
-        # Calculate the straight-line distance between the input satellite and each satellite in the list
-        sat_diff = cur_routing_sat.sat.at(cur_time) - r_s.sat.at(cur_time)
-        
-        # Update the closest satellite and minimum distance if a new minimum is found
-        if sat_diff.distance().km < min_distance:
-            closest_routing_sat = r_s
-            min_distance = sat_diff.distance().km
-    return closest_routing_sat
+    if len(routing_sat_list) < 1:
+        return None
+    # straight-line distance from the input satellite to every satellite in the list in one vectorized pass
+    satnum_index = get_constellation_snapshot().satnum_index
+    rows = [satnum_index[r_s.satnum] for r_s in routing_sat_list]
+    closest_row = get_spatial_index().get_closest_row(satnum_index[cur_routing_sat.satnum], np.array(rows))
+    return routing_sat_list[rows.index(closest_row)]
+
+def get_registry_rows(sat_list): # propagator row of each EarthSatellite, None unless every one is a registry satellite
+    satnum_index = get_propagator().satnum_index
+    rows = []
+    for s in sat_list:
+        r_sat = sat_registry.get_by_satnum(s.model.satnum)
+        if (r_sat is None) or (r_sat.get_satrec() is not s.model):
+            return None
+        rows.append(satnum_index[s.model.satnum])
+    return np.array(rows, dtype=np.int64)
 
 def find_closest_satellite(sat, sat_list, t):
+    if len(sat_list) < 1:
+        return None
+    rows = get_registry_rows([sat] + list(sat_list))
+    if rows is not None: # one vectorized distance pass over the constellation snapshot at t
+        snapshot = sat_snapshot_cache.get(t, get_propagator())
+        closest_row = get_spatial_index(snapshot).get_closest_row(rows[0], rows[1:])
+        return sat_list[int(np.flatnonzero(rows[1:] == closest_row)[0])]
+
+    # satellites outside the constellation: per-satellite skyfield scan
     closest_sat = None
     min_distance = float('inf') # Initialize minimum distance to infinity
     
@@ -260,11 +1015,15 @@ def get_satellite_height(sat, t):
     return height.km
 
 def sat_is_North_of(sat1_geoc, sat2_geoc): # is sat1 more north than sat2
+    if isinstance(sat1_geoc, routing_sat) and isinstance(sat2_geoc, routing_sat): # read from the cur_time snapshot
+        return sat1_geoc.get_sat_lat_degrees() > sat2_geoc.get_sat_lat_degrees()
     sat1_lat, _ = wgs84.latlon_of(sat1_geoc)
     sat2_lat, _ = wgs84.latlon_of(sat2_geoc)
     return sat1_lat.degrees > sat2_lat.degrees
 
 def sat_is_East_of(sat1_geoc, sat2_geoc): # is sat1 more east than sat2
+    if isinstance(sat1_geoc, routing_sat) and isinstance(sat2_geoc, routing_sat): # read from the cur_time snapshot
+        return sat1_geoc.get_sat_lon_degrees() > sat2_geoc.get_sat_lon_degrees()
     _, sat1_lon = wgs84.latlon_of(sat1_geoc)
     _, sat2_lon = wgs84.latlon_of(sat2_geoc)
     return sat1_lon.degrees > sat2_lon.degrees
@@ -273,49 +1032,42 @@ def get_sat_distance(sat1_geoc, sat2_geoc): # returns distance between satellite
     return (sat1_geoc - sat2_geoc).distance().km
 
 def increment_time():
-    python_t = cur_time.utc_datetime()
-    new_python_time = python_t + timedelta(seconds = time_interval)
-    cur_time = time_scale.utc(new_python_time.year, new_python_time.month, new_python_time.day, new_python_time.hour, new_python_time.minute, new_python_time.second)
-
-def draw_static_plot(satnum_list, title='figure'): # Given a list of satnums, generate a static plot
+    set_cur_time(cur_time + time_interval / DAY_S)
+
+def get_renderer(): # imports the plotting layer on first use, so batch runs and worker processes never load matplotlib
+    global renderer
+    if renderer is None:
+        import orbit_renderer
+        renderer = orbit_renderer
+    renderer.set_headless(headless)
+    return renderer
+
+def finish_rendering(): # waits for background PNG renders; returns the written paths
+    if renderer is None:
+        return []
+    return renderer.wait_for_renders()
+
+def draw_static_plot(satnum_list, title='figure', out_path=None): # Given a list of satnums, generate a static plot
+    # interactive window by default; writes a PNG on the background render thread when out_path is given or in
+    # headless mode (into plot_output_dir). Returns the render Future, or None when nothing was rendered in the background
+    global plot_count
+    if headless and (out_path is None) and (plot_output_dir is None):
+        return None
+    state = get_constellation_state()
+    positions = np.array([state.get_position_km(satnum, 'teme') for satnum in satnum_list]).reshape(-1, 3)
+    x_array, y_array, z_array = positions[:, 0], positions[:, 1], positions[:, 2]
+    plot_count += 1
+    if headless and (out_path is None):
+        out_path = get_renderer().get_plot_path(plot_output_dir, title, plot_count)
+    if out_path is not None:
+        return get_renderer().submit_route_png(x_array, y_array, z_array, title, out_path)
+    get_renderer().show_route(x_array, y_array, z_array, title)
+    return None
 
-    # ::: STATIC COLORED ORBITS :::
-    # Original version based on: https://stackoverflow.com/questions/51891538/create-a-surface-plot-of-xyz-altitude-data-in-python
-    
-    color_array = []
-    colors = ['red', 'purple', 'blue', 'orange', 'green', 'yellow', 'olive', 'cyan', 'brown']
-    x_array = []
-    y_array = []
-    z_array = []
-    
-    #for orbit_index in orbit_index_list:
-    color_index = 0
-    for satnum in satnum_list:
-            geocentric = sat_object_list[satnum].get_curr_geocentric()
-            x, y, z = geocentric.position.km
-            x_array.append(x)
-            y_array.append(y)
-            z_array.append(z)
-            #orbit_color = colors[sat_object_list[satnum].orbit_number%len(colors)]
-            #color_array.append(orbit_color)
-            color_array.append(colors[color_index])
-            color_index = (color_index + 1) % len(colors)
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
-    ax.set_title(title)
-    # hardcode the xyz limites to keep all satellite plots on same scale
-    ax_min = -6000
-    ax_max = 6000
-    ax.set_xlim3d(ax_min, ax_max)
-    ax.set_ylim3d(ax_min, ax_max)
-    ax.set_zlim3d(ax_min, ax_max)
-
-    ax.scatter(x_array, y_array, z_array, c=color_array)
-    ax.plot(x_array, y_array, z_array, color = 'black')
-    plt.show()
-
-def test_NSEW(orbit_list):
+def test_NSEW(orbit_list=None):
         # :: Testing N/S/E/W ::
+        if orbit_list is None:
+            orbit_list = get_orbit_list()
 
         h_range = range(0, 24)
         t_span = time_scale.utc(2023, 5, 9, h_range)
@@ -405,9 +1157,11 @@ def test_NSEW(orbit_list):
             print("\n")
             """
 
-def test_sat_distances(orbit_list):
+def test_sat_distances(orbit_list=None):
         
         # :: Testing Satellite Distances ::
+        if orbit_list is None:
+            orbit_list = get_orbit_list()
         t = time_scale.utc(2023, 5, 9, 14)
         i = 0
         test_orbit_index = random.randint(0, len(orbit_list)-1)
@@ -458,6 +1212,7 @@ def static_draw_orig():
     # Original version based on: https://stackoverflow.com/questions/51891538/create-a-surface-plot-of-xyz-altitude-data-in-python
     # Number of orbits to draw
     max_num_orbits_to_draw = 12
+    orbit_list = get_orbit_list()
 
     # time interval covered
     m_range = range(0, 60)
@@ -484,6 +1239,7 @@ def static_draw_orig():
     # ::: STATIC COLORED ORBITS :::
     # Original version based on: https://stackoverflow.com/questions/51891538/create-a-surface-plot-of-xyz-altitude-data-in-python
     if draw_static_orbits:
+        plt = get_renderer().get_pyplot()
         color_array = []
         colors = ['red', 'purple', 'blue', 'orange', 'green', 'yellow', 'olive', 'cyan', 'brown']
         x_array = []
@@ -506,89 +1262,40 @@ def static_draw_orig():
         ax.scatter(x_array, y_array, z_array, c=color_array)
         plt.show()
 
-def draw_dynamic_orig():
-    # Number of orbits to draw
-    max_num_orbits_to_draw = 12
-
-    # time interval covered
-    m_range = range(0, 60)
-    h_range = range(0, 24)
-    t_span = []
-    for h in h_range:
-        for m in m_range:
-            t_span.append(time_scale.utc(2023, 5, 9, h, m))
-    #t_span = ts.utc(2023, 5, 9, h_range)
-
-    # calculating which orbits to draw
-    orbit_index_list = []
-    """
-    # if spacing orbits out equally
-    draw_orbit_index = int(orbit_cnt/max_num_orbits_to_draw)
-    for orbit_index in range(len(orbit_list)):
-        if (orbit_index%draw_orbit_index == 0):
-        orbit_index_list.append(orbit_index) 
-    """
-    # if drawing sequential orbits
-    for orbit_index in range((min(max_num_orbits_to_draw, len(orbit_list)))):
-        orbit_index_list.append(orbit_index)
-    # ::: ANIMATED ORBITS :::
-    # Updating plot over time:  https://www.geeksforgeeks.org/how-to-update-a-plot-on-same-figure-during-the-loop/
-    plt.ion() # used to run GUI event loop
-    
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
-
-    empty_array = []
-    #sp = ax.scatter(X, Y, Z, c=color_array)
-    #sp = ax.scatter(empty_array, empty_array, empty_array, c='red')
-    ax_min = -6000
-    ax_max = 6000
-
-    ax.set_xlim3d(ax_min, ax_max)
-    ax.set_ylim3d(ax_min, ax_max)
-    ax.set_zlim3d(ax_min, ax_max)
-
-    # assuming equal number of satellites in each orbit
-    colors = ['red', 'blue', 'green', 'yellow', 'orange', 'purple', 'olive', 'cyan', 'brown']
-    color_array = []
-    #for orbit_index in range(len(orbit_list[0])):
-    #    orbit_color = colors[orbit_index%len(colors)]
-    #    color_array.append(orbit_color)
-
-
-    #sp = ax.scatter(empty_array, empty_array, empty_array, c=color_array)
-    sp = ax.scatter(empty_array, empty_array, empty_array)
-    fig.show()
-
-    for t_i in t_span:  # t_span defined at start of plotting section
-        x_array = []
-        y_array = []
-        z_array = []
-        for orbit_index in orbit_index_list:
-            orbit = orbit_list[orbit_index]
-            for s in orbit:
-                geocentric = s.at(t_i)
-                x, y, z = geocentric.position.km
-                x_array.append(x)
-                y_array.append(y)
-                z_array.append(z)
-                #orbit_color = colors[orbit_index%len(colors)]
-                #color_array.append(orbit_color)
-
-        X = np.array(x_array)
-        Y = np.array(y_array)
-        Z = np.array(z_array)
-        sp._offsets3d = (X, Y, Z)
-        #sp.set_segments(X, Y, Z)
-        #sp.set(color=color_array)
-        plt.draw()
-        plt.pause(.1)
-    plt.waitforbuttonpress()
+def compute_orbit_frames(start_time=None, num_frames=1440, step_seconds=animation_frame_seconds, orbit_numbers=None):
+    # (T, N, 3) float32 TEME km for every frame from batch propagation, and the orbit number of each column
+    if start_time is None:
+        start_time = cur_time
+    propagator = get_propagator()
+    orbit_number = sat_registry.get_slot_arrays()[0]
+    columns = np.arange(len(orbit_number)) if orbit_numbers is None else np.flatnonzero(np.isin(orbit_number, list(orbit_numbers)))
+    times = get_time_grid(start_time, num_frames, step_seconds)
+    frames = np.empty((num_frames, len(columns), 3), dtype=np.float32)
+    for first in range(0, num_frames, simulation_chunk_steps):
+        state = propagator.propagate(times[first:first + simulation_chunk_steps])
+        frames[first:first + simulation_chunk_steps] = state.teme_r[:, columns]
+    return frames, orbit_number[columns]
+
+def draw_dynamic_orig(out_path=None, max_num_orbits_to_draw=None, num_frames=1440):
+    # one day of the constellation (every plane by default) at animation_frame_seconds per frame, propagated up front
+    # and played back with a blitted FuncAnimation; written to out_path / animation_path when given, or shown
+    if out_path is None:
+        out_path = animation_path
+    if headless and (out_path is None):
+        return None
+    orbit_numbers = None if max_num_orbits_to_draw is None else sorted(sat_registry.orbits)[:max_num_orbits_to_draw]
+    start = time.time()
+    frames, frame_orbit_numbers = compute_orbit_frames(time_scale.utc(2023, 5, 9), num_frames, animation_frame_seconds, orbit_numbers)
+    print(f'Propagated {frames.shape[0]} frames x {frames.shape[1]} satellites in {time.time() - start:.2f} seconds')
+    title = f'{len(np.unique(frame_orbit_numbers))} orbits, {animation_frame_seconds}s per frame'
+    if out_path is not None:
+        return get_renderer().save_orbit_animation(frames, frame_orbit_numbers, out_path, title, animation_fps)
+    return get_renderer().show_orbit_animation(frames, frame_orbit_numbers, title, animation_fps)
 
 def plot_NSEW():
         random_satnum = random.randint(0, (orbit_cnt * sats_per_orbit)-1)
         test_list = [random_satnum] # test satellite is first
-        random_sat = sat_object_list[random_satnum]
+        random_sat = get_routing_sat_obj_by_satnum(random_satnum)
         print(f'Selected sat has satnum: {random_sat.satnum}')
         random_sat_East = random_sat.get_sat_East()
         print(f'Random sat East has satnum: {random_sat_East.satnum}')
@@ -600,7 +1307,7 @@ def plot_NSEW():
         draw_static_plot(test_list, 'East-West satellites')
         
         test_list = [random_satnum] # test satellite is first
-        random_sat = sat_object_list[random_satnum]
+        random_sat = get_routing_sat_obj_by_satnum(random_satnum)
         print(f'Selected sat has satnum: {random_sat.satnum}')
         random_sat_North = random_sat.get_sat_North()
         print(f'Random sat North has satnum: {random_sat_North.satnum}')
@@ -700,23 +1407,28 @@ def test_circumnavigate():
 
     draw_static_plot(test_list, f"Go East, Northx2, West - {len(test_list)} sats")
 
+def print_overhead_satellite(r_sat, location, location_name): # look angles from the snapshot, no skyfield propagation
+    elevation, azimuth, slant_range = get_spatial_index().get_look_angles(location, get_constellation_snapshot().satnum_index[r_sat.satnum])
+    print(f'Satellite {r_sat.satnum} is at least {req_elev}deg off horizon in {location_name}')
+    print(f'\tElevation: {elevation:.4f}deg\n\tAzimuth: {azimuth:.4f}deg\n\tDistance: {slant_range:.1f}km')
+
 def find_route_random(src, dest):
     # Find satellite at least 60 deg above the horizon at source
-    for r_sat in sat_object_list:
-        if (r_sat.is_overhead_of(src)):
-            topo_position = (r_sat.sat - src).at(cur_time)
-            alt, az, dist = topo_position.altaz()    
-            print(f'Satellite {r_sat.sat.model.satnum} is at least 30deg off horizon in Blacksburg')
-            print(f'\tElevation: {alt.degrees}\n\tAzimuth: {az}\n\tDistance: {dist.km:.1f}km')
-            break # Just go with first satellite
+    r_sat = get_overhead_routing_sat(src) # Go with the highest satellite
+    if r_sat is None:
+        print(f'No satellite is at least {req_elev}deg off horizon at source')
+        return
+    print_overhead_satellite(r_sat, src, 'Blacksburg')
 
+    # every satellite above req_elev at the destination, from one elevation cone query instead of an altaz() per hop
+    dest_overhead_satnums = set(get_spatial_index().query_elevation_cone(dest)[0].tolist())
     cur_routing_sat = r_sat
     sat_traverse_list = []
     link_distance = 0
     start = time.process_time()
     while True:
-        sat_traverse_list.append(cur_routing_sat.sat.model.satnum)
-        if cur_routing_sat.is_overhead_of(dest):
+        sat_traverse_list.append(cur_routing_sat.satnum)
+        if cur_routing_sat.satnum in dest_overhead_satnums:
             print('Made it to Destination')
             break
         go_North = not cur_routing_sat.is_North_of(dest)     
@@ -724,9 +1436,6 @@ def find_route_random(src, dest):
 
         go_lat = random.randint(0,1)
 
-        topo_diff = (cur_routing_sat.sat - dest).at(cur_time)
-        _, _, dist = topo_diff.altaz()
-
         if go_lat:
             go_lat = False
             if go_North:
@@ -739,41 +1448,37 @@ def find_route_random(src, dest):
                 next_routing_sat = cur_routing_sat.get_sat_East()
             else:
                 next_routing_sat = cur_routing_sat.get_sat_West()
-        link_distance += get_sat_distance(cur_routing_sat.sat.at(cur_time), next_routing_sat.sat.at(cur_time))
+        link_distance += get_routing_sat_distance(cur_routing_sat, next_routing_sat)
         cur_routing_sat = next_routing_sat
     compute_time = time.process_time() - start
     print(f'Made {len(sat_traverse_list)} satellite hops to get to destination; distance of {link_distance:.2f}km ({link_distance * secs_per_km:.2f} seconds); compute time: {compute_time}')
     draw_static_plot(sat_traverse_list, title=f'Random: {len(sat_traverse_list)} satellite hops; distance {link_distance:.2f}km')
+    return route_result(sat_traverse_list, link_distance, len(sat_traverse_list), compute_time, 'random')
 
 def find_route_dijkstra(src, dest):
     # Find satellite at least 60 deg above the horizon at source and destination
     # FIX: distances must also include the satnum of which sat put the lowest distance!  Must follow that listing backwards to id path to the source
-    for r_sat in sat_object_list:
-        if (r_sat.is_overhead_of(src)):
-            topo_position = (r_sat.sat - src).at(cur_time)
-            alt, az, dist = topo_position.altaz()    
-            print(f'Satellite {r_sat.sat.model.satnum} is at least 30deg off horizon in destination')
-            print(f'\tElevation: {alt.degrees}\n\tAzimuth: {az}\n\tDistance: {dist.km:.1f}km')
-            break # Just go with first satellite
-    src_routing_sat = r_sat
-
-    for r_sat in sat_object_list:
-        if (r_sat.is_overhead_of(dest)):
-            topo_position = (r_sat.sat - dest).at(cur_time)
-            alt, az, dist = topo_position.altaz()    
-            print(f'Satellite {r_sat.sat.model.satnum} is at least 30deg off horizon in destination')
-            print(f'\tElevation: {alt.degrees}\n\tAzimuth: {az}\n\tDistance: {dist.km:.1f}km')
-            break # Just go with first satellite
-    dest_routing_sat = r_sat
+    src_routing_sat = get_overhead_routing_sat(src) # Go with the highest satellite
+    if src_routing_sat is None:
+        print(f'No satellite is at least {req_elev}deg off horizon in source')
+        return
+    print_overhead_satellite(src_routing_sat, src, 'source')
+    dest_routing_sat = get_overhead_routing_sat(dest)
+    if dest_routing_sat is None:
+        print(f'No satellite is at least {req_elev}deg off horizon in destination')
+        return
+    print_overhead_satellite(dest_routing_sat, dest, 'destination')
+
+    if src_routing_sat.satnum == dest_routing_sat.satnum: # one satellite covers both ends: zero ISL hops, nothing to retrace
+        print(f'Satellite {src_routing_sat.satnum} is overhead of both source and destination')
+        return route_result([src_routing_sat.satnum], 0.0, 1, 0.0, 'dijkstra')
 
     visited_sat_dict = {} #(satnum, (distance, satnum_who_assigned_distance))
 
-    unvisted_sat_dict = {} # dict of satnums with respective tentative distance values
-    for r_sat in sat_object_list:
-        unvisted_sat_dict[r_sat.sat.model.satnum] = (float('inf'), -1)
+    unvisted_sat_dict = dict.fromkeys(get_constellation_snapshot().satnum_index, (float('inf'), -1)) # dict of satnums with respective tentative distance values
 
     cur_sat = src_routing_sat
-    unvisted_sat_dict[cur_sat.sat.model.satnum] = (0, -1)
+    unvisted_sat_dict[cur_sat.satnum] = (0, -1)
     
     cur_sat_dist = 0
     route_found = False
@@ -784,45 +1489,45 @@ def find_route_dijkstra(src, dest):
         neigh_North = cur_sat.get_sat_North()
         if neigh_North is not None: # There is a more Northern Neighbor
             testing_sat = neigh_North
-            if testing_sat.sat.model.satnum in unvisted_sat_dict:
-                testing_sat_dist = get_sat_distance(cur_sat.sat.at(cur_time), testing_sat.sat.at(cur_time))
+            if testing_sat.satnum in unvisted_sat_dict:
+                testing_sat_dist = get_routing_sat_distance(cur_sat, testing_sat)
                 tentative_dist = cur_sat_dist + testing_sat_dist
-                if tentative_dist < unvisted_sat_dict[testing_sat.sat.model.satnum][0]:
-                    unvisted_sat_dict[testing_sat.sat.model.satnum] = (tentative_dist, cur_sat.sat.model.satnum)
+                if tentative_dist < unvisted_sat_dict[testing_sat.satnum][0]:
+                    unvisted_sat_dict[testing_sat.satnum] = (tentative_dist, cur_sat.satnum)
                 
         neigh_South = cur_sat.get_sat_South()
         if neigh_South is not None: # There is a more Southern Neighbor
             testing_sat = neigh_South
-            if testing_sat.sat.model.satnum in unvisted_sat_dict:
-                testing_sat_dist = get_sat_distance(cur_sat.sat.at(cur_time), testing_sat.sat.at(cur_time))
+            if testing_sat.satnum in unvisted_sat_dict:
+                testing_sat_dist = get_routing_sat_distance(cur_sat, testing_sat)
                 tentative_dist = cur_sat_dist + testing_sat_dist
-                if tentative_dist < unvisted_sat_dict[testing_sat.sat.model.satnum][0]:
-                    unvisted_sat_dict[testing_sat.sat.model.satnum] = (tentative_dist, cur_sat.sat.model.satnum)
+                if tentative_dist < unvisted_sat_dict[testing_sat.satnum][0]:
+                    unvisted_sat_dict[testing_sat.satnum] = (tentative_dist, cur_sat.satnum)
 
         neigh_East = cur_sat.get_sat_East()
         if neigh_East is not None: # There is a more Eastern Neighbor
             testing_sat = neigh_East
-            if testing_sat.sat.model.satnum in unvisted_sat_dict:
-                testing_sat_dist = get_sat_distance(cur_sat.sat.at(cur_time), testing_sat.sat.at(cur_time))
+            if testing_sat.satnum in unvisted_sat_dict:
+                testing_sat_dist = get_routing_sat_distance(cur_sat, testing_sat)
                 tentative_dist = cur_sat_dist + testing_sat_dist
-                if tentative_dist < unvisted_sat_dict[testing_sat.sat.model.satnum][0]:
-                    unvisted_sat_dict[testing_sat.sat.model.satnum] = (tentative_dist, cur_sat.sat.model.satnum)
+                if tentative_dist < unvisted_sat_dict[testing_sat.satnum][0]:
+                    unvisted_sat_dict[testing_sat.satnum] = (tentative_dist, cur_sat.satnum)
 
         neigh_West = cur_sat.get_sat_West()
         if neigh_West is not None: # There is a more Western Neighbor
             testing_sat = neigh_West
-            if testing_sat.sat.model.satnum in unvisted_sat_dict:
-                testing_sat_dist = get_sat_distance(cur_sat.sat.at(cur_time), testing_sat.sat.at(cur_time))
+            if testing_sat.satnum in unvisted_sat_dict:
+                testing_sat_dist = get_routing_sat_distance(cur_sat, testing_sat)
                 tentative_dist = cur_sat_dist + testing_sat_dist
-                if tentative_dist < unvisted_sat_dict[testing_sat.sat.model.satnum][0]:
-                    unvisted_sat_dict[testing_sat.sat.model.satnum] = (tentative_dist, cur_sat.sat.model.satnum)
+                if tentative_dist < unvisted_sat_dict[testing_sat.satnum][0]:
+                    unvisted_sat_dict[testing_sat.satnum] = (tentative_dist, cur_sat.satnum)
 
         # Done setting distances for adjacent satellites, move current satellite to visited_sat_dict and remove it's entry in unvisted_sat_dict
-        visited_sat_dict[cur_sat.sat.model.satnum] = unvisted_sat_dict[cur_sat.sat.model.satnum]
-        del unvisted_sat_dict[cur_sat.sat.model.satnum]
+        visited_sat_dict[cur_sat.satnum] = unvisted_sat_dict[cur_sat.satnum]
+        del unvisted_sat_dict[cur_sat.satnum]
         
         # Test to see if we just set the destination node as 'visited'
-        if cur_sat.sat.model.satnum == dest_routing_sat.sat.model.satnum:
+        if cur_sat.satnum == dest_routing_sat.satnum:
             print("Algorithm reached destination node")
             route_found = True  # Indicate the destination has been reached and break out of the loop
             break
@@ -847,7 +1552,7 @@ def find_route_dijkstra(src, dest):
 
         # Get sat routing object for indicated satnum
         cur_sat = get_routing_sat_obj_by_satnum(next_hop_satnum)
-        cur_sat_dist = unvisted_sat_dict[cur_sat.sat.model.satnum][0]
+        cur_sat_dist = unvisted_sat_dict[cur_sat.satnum][0]
         #for routing_sat_obj in sat_object_list:
         #    if routing_sat_obj.sat.model.satnum == next_hop:
         #        cur_sat = routing_sat_obj
@@ -860,14 +1565,14 @@ def find_route_dijkstra(src, dest):
     # Route was found, so retrace steps
     #print(visited_sat_dict)
     print(f'Visited list has {len(visited_sat_dict)} entries')
-    traverse_list = [dest_routing_sat.sat.model.satnum]
-    cur_satnum = dest_routing_sat.sat.model.satnum
+    traverse_list = [dest_routing_sat.satnum]
+    cur_satnum = dest_routing_sat.satnum
     link_distance = 0
     while True:
         next_hop = visited_sat_dict[cur_satnum][1]
-        link_distance += get_sat_distance(get_routing_sat_obj_by_satnum(cur_satnum).sat.at(cur_time), get_routing_sat_obj_by_satnum(next_hop).sat.at(cur_time))
+        link_distance += get_routing_sat_distance(get_routing_sat_obj_by_satnum(cur_satnum), get_routing_sat_obj_by_satnum(next_hop))
         traverse_list.insert(0, next_hop)
-        if next_hop == src_routing_sat.sat.model.satnum:
+        if next_hop == src_routing_sat.satnum:
             break
         cur_satnum = next_hop
 
@@ -877,20 +1582,1372 @@ def find_route_dijkstra(src, dest):
     #for key in visited_sat_dict.keys():
     #    traverse_list.append(key)
     draw_static_plot(traverse_list, title=f'Dijkstra: {len(traverse_list)} hops, {link_distance:.2f}km distance')
-    
-        
-def main ():
+    return route_result(traverse_list, link_distance, len(visited_sat_dict), compute_time, 'dijkstra')
+
+## :: Routing Engine ::
+# +Grid adjacency built once per snapshot, then searched with a binary-heap Dijkstra
+class topology_snapshot:
+    def __init__(self, t, satnums, indptr, indices, lengths_km, positions_km, satnum_index=None):
+        self.t = t
+        self.satnums = satnums # row -> satnum
+        if satnum_index is None:
+            satnum_index = {satnum: row for row, satnum in enumerate(satnums.tolist())}
+        self.satnum_index = satnum_index # satnum -> row
+        self.indptr = indptr # CSR row pointers, neighbours of row i are indices[indptr[i]:indptr[i+1]]
+        self.indices = indices # neighbour rows
+        self.lengths_km = lengths_km # ISL length of each link
+        self.positions_km = positions_km # (N, 3) ITRS position of each row, used by the A* heuristic
+        self.reverse_csr = None # (indptr, indices, lengths) of the reversed links, built for bidirectional search
+        self.link_sources = None # source row of each link, built on demand
+        self.neighbour_table = None # (N, max_degree) neighbour rows padded with -1, built on demand
+        self.sparse_matrix = None # scipy CSR matrix of link lengths, built on demand
+        # plain lists are much faster than numpy scalars inside the Python search loops
+        self.indptr_list = indptr.tolist()
+        self.indices_list = indices.tolist()
+        self.lengths_list = lengths_km.tolist()
+
+    def get_num_sats(self):
+        return len(self.satnums)
+
+    def get_neighbours(self, row): # (neighbour rows, link lengths in km)
+        start, end = self.indptr[row], self.indptr[row+1]
+        return self.indices[start:end], self.lengths_km[start:end]
+
+    def get_link_sources(self):
+        if self.link_sources is None:
+            self.link_sources = np.repeat(np.arange(self.get_num_sats()), np.diff(self.indptr))
+        return self.link_sources
+
+    def get_neighbour_table(self): # (neighbour rows, link lengths) as dense (N, max_degree) arrays for vectorized lookups
+        if self.neighbour_table is None:
+            num_sats = self.get_num_sats()
+            degree = np.diff(self.indptr)
+            max_degree = int(degree.max()) if num_sats > 0 else 0
+            slot = np.arange(len(self.indices)) - np.repeat(self.indptr[:-1], degree)
+            table_rows = np.full((num_sats, max_degree), -1, dtype=np.int64)
+            table_lengths = np.full((num_sats, max_degree), np.inf)
+            table_rows[self.get_link_sources(), slot] = self.indices
+            table_lengths[self.get_link_sources(), slot] = self.lengths_km
+            self.neighbour_table = (table_rows, table_lengths)
+        return self.neighbour_table
+
+    def get_reverse_csr(self): # incoming links per row, as lists; links are directed so this is not just the forward CSR
+        if self.reverse_csr is None:
+            num_sats = self.get_num_sats()
+            link_sources = self.get_link_sources()
+            order = np.argsort(self.indices, kind='stable')
+            reverse_indptr = np.zeros(num_sats + 1, dtype=np.int64)
+            reverse_indptr[1:] = np.cumsum(np.bincount(self.indices, minlength=num_sats))
+            self.reverse_csr = (reverse_indptr.tolist(), link_sources[order].tolist(), self.lengths_km[order].tolist())
+        return self.reverse_csr
+
+class route_result:
+    def __init__(self, satnum_list, distance_km, nodes_expanded, compute_time, mode='dijkstra'):
+        self.satnum_list = satnum_list # path from source satellite to destination satellite
+        self.distance_km = distance_km
+        self.latency = distance_km * secs_per_km # seconds of propagation delay
+        self.nodes_expanded = nodes_expanded
+        self.compute_time = compute_time
+        self.mode = mode
+
+    def get_hop_count(self):
+        return len(self.satnum_list)
+
+def build_topology_snapshot(): # N/S/E/W links of every satellite at cur_time
+    snapshot = get_constellation_snapshot()
+    state = snapshot.state
+    resolver = get_neighbour_resolver()
+    satnums = resolver.satnums
+    num_sats = len(satnums)
+    neighbour_rows = resolver.neighbour_rows
+    valid = (neighbour_rows >= 0) & (neighbour_rows != np.arange(num_sats)[:, np.newaxis])
+    for column in range(1, neighbour_rows.shape[1]): # drop a neighbour already linked through an earlier direction
+        for earlier in range(column):
+            valid[:, column] &= neighbour_rows[:, column] != neighbour_rows[:, earlier]
+
+    indptr = np.zeros(num_sats + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(valid.sum(axis=1))
+    indices = neighbour_rows[valid] # row-major, so each satellite keeps its N, S, E, W order
+    link_sources = np.repeat(np.arange(num_sats), np.diff(indptr))
+    link_diff = state.itrs_r[indices] - state.itrs_r[link_sources]
+    lengths_km = np.sqrt((link_diff * link_diff).sum(axis=1))
+    return topology_snapshot(snapshot.t, satnums, indptr, indices, lengths_km, state.itrs_r, state.satnum_index)
+
+def get_topology_snapshot(): # cached on the constellation snapshot, so it is rebuilt only when time advances
+    snapshot = get_constellation_snapshot()
+    if snapshot.topology is None:
+        snapshot.topology = build_topology_snapshot()
+    return snapshot.topology
+
+def dijkstra_rows(topology, src_row, dest_row=None): # returns (dist, pred, nodes_expanded); stops early once dest_row is settled
+    indptr = topology.indptr_list
+    indices = topology.indices_list
+    lengths = topology.lengths_list
+    num_sats = topology.get_num_sats()
+    dist = [float('inf')] * num_sats
+    pred = [-1] * num_sats
+    visited = [False] * num_sats
+    dist[src_row] = 0.0
+    heap = [(0.0, src_row)]
+    nodes_expanded = 0
+    while heap:
+        cur_dist, cur_row = heapq.heappop(heap)
+        if visited[cur_row]:
+            continue # stale heap entry
+        visited[cur_row] = True
+        nodes_expanded += 1
+        if cur_row == dest_row:
+            break
+        for k in range(indptr[cur_row], indptr[cur_row+1]):
+            neighbour_row = indices[k]
+            tentative_dist = cur_dist + lengths[k]
+            if tentative_dist < dist[neighbour_row]:
+                dist[neighbour_row] = tentative_dist
+                pred[neighbour_row] = cur_row
+                heapq.heappush(heap, (tentative_dist, neighbour_row))
+    return dist, pred, nodes_expanded
+
+def astar_rows(topology, src_row, dest_row): # returns (dist, pred, nodes_expanded)
+    # ISLs are straight lines, so the chord to the destination never overestimates the remaining distance
+    indptr = topology.indptr_list
+    indices = topology.indices_list
+    lengths = topology.lengths_list
+    diff = topology.positions_km - topology.positions_km[dest_row]
+    heuristic = np.sqrt((diff * diff).sum(axis=1)).tolist()
+    num_sats = topology.get_num_sats()
+    dist = [float('inf')] * num_sats
+    pred = [-1] * num_sats
+    visited = [False] * num_sats
+    dist[src_row] = 0.0
+    heap = [(heuristic[src_row], src_row)]
+    nodes_expanded = 0
+    while heap:
+        _, cur_row = heapq.heappop(heap)
+        if visited[cur_row]:
+            continue
+        visited[cur_row] = True
+        nodes_expanded += 1
+        if cur_row == dest_row:
+            break
+        cur_dist = dist[cur_row]
+        for k in range(indptr[cur_row], indptr[cur_row+1]):
+            neighbour_row = indices[k]
+            tentative_dist = cur_dist + lengths[k]
+            if tentative_dist < dist[neighbour_row]:
+                dist[neighbour_row] = tentative_dist
+                pred[neighbour_row] = cur_row
+                heapq.heappush(heap, (tentative_dist + heuristic[neighbour_row], neighbour_row))
+    return dist, pred, nodes_expanded
+
+def bidirectional_dijkstra_rows(topology, src_row, dest_row): # returns (distance, path_rows, nodes_expanded)
+    num_sats = topology.get_num_sats()
+    csr = ((topology.indptr_list, topology.indices_list, topology.lengths_list), topology.get_reverse_csr())
+    dist = ([float('inf')] * num_sats, [float('inf')] * num_sats) # [0] forward from src, [1] backward from dest
+    pred = ([-1] * num_sats, [-1] * num_sats)
+    visited = ([False] * num_sats, [False] * num_sats)
+    heaps = ([(0.0, src_row)], [(0.0, dest_row)])
+    dist[0][src_row] = 0.0
+    dist[1][dest_row] = 0.0
+    best_dist = float('inf')
+    meet_row = -1
+    nodes_expanded = 0
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best_dist:
+            break # no shorter path can still be found
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1 # expand the side with the smaller frontier key
+        cur_dist, cur_row = heapq.heappop(heaps[side])
+        if visited[side][cur_row]:
+            continue
+        visited[side][cur_row] = True
+        nodes_expanded += 1
+        indptr, indices, lengths = csr[side]
+        side_dist = dist[side]
+        other_dist = dist[1 - side]
+        for k in range(indptr[cur_row], indptr[cur_row+1]):
+            neighbour_row = indices[k]
+            tentative_dist = cur_dist + lengths[k]
+            if tentative_dist < side_dist[neighbour_row]:
+                side_dist[neighbour_row] = tentative_dist
+                pred[side][neighbour_row] = cur_row
+                heapq.heappush(heaps[side], (tentative_dist, neighbour_row))
+            if tentative_dist + other_dist[neighbour_row] < best_dist:
+                best_dist = tentative_dist + other_dist[neighbour_row]
+                meet_row = neighbour_row
+    if src_row == dest_row:
+        return 0.0, [src_row], nodes_expanded
+    if meet_row < 0:
+        return float('inf'), None, nodes_expanded
+    path = retrace_path_rows(pred[0], src_row, meet_row)
+    cur_row = meet_row
+    while cur_row != dest_row: # backward predecessors point towards dest
+        cur_row = pred[1][cur_row]
+        path.append(cur_row)
+    return best_dist, path, nodes_expanded
+
+def retrace_path_rows(pred, src_row, dest_row):
+    path = [dest_row]
+    while path[-1] != src_row:
+        next_hop = pred[path[-1]]
+        if next_hop < 0:
+            return None # dest_row was never reached
+        path.append(next_hop)
+    path.reverse()
+    return path
+
+route_modes = ('dijkstra', 'astar', 'bidirectional', 'csgraph')
+
+def find_route_satnums(src_satnum, dest_satnum, topology=None, mode='dijkstra'): # shortest path between two satellites
+    if mode not in route_modes:
+        raise ValueError(f"Unknown routing mode '{mode}', expected one of {route_modes}")
+    if topology is None:
+        topology = get_topology_snapshot()
+    start = time.process_time()
+    src_row = topology.satnum_index[src_satnum]
+    dest_row = topology.satnum_index[dest_satnum]
+    if mode == 'bidirectional':
+        distance_km, path_rows, nodes_expanded = bidirectional_dijkstra_rows(topology, src_row, dest_row)
+    else:
+        if mode == 'csgraph':
+            dist, pred, nodes_expanded = csgraph_dijkstra_rows(topology, src_row)
+        elif mode == 'astar':
+            dist, pred, nodes_expanded = astar_rows(topology, src_row, dest_row)
+        else:
+            dist, pred, nodes_expanded = dijkstra_rows(topology, src_row, dest_row)
+        distance_km = dist[dest_row]
+        path_rows = retrace_path_rows(pred, src_row, dest_row)
+    compute_time = time.process_time() - start
+    if path_rows is None:
+        return None
+    return route_result(topology.satnums[path_rows].tolist(), distance_km, nodes_expanded, compute_time, mode)
+
+def get_overhead_routing_sat(location): # satellite at least req_elev above the horizon of a ground location
+    # from ground_access_table when it covers this location (longest remaining pass), otherwise highest elevation
+    if (ground_access_table is not None) and (ground_access_table.min_elev == req_elev) and ground_access_table.covers(cur_time):
+        if ground_access_table.get_station_index(location) is not None: # precomputed: no geometry needed
+            satnum = ground_access_table.get_ingress_satnum(location)
+            return None if satnum is None else get_routing_sat_obj_by_satnum(satnum)
+    satnum = get_spatial_index().get_best_overhead_satnum(location)
+    if satnum is None:
+        return None
+    return get_routing_sat_obj_by_satnum(satnum)
+
+def find_route_engine(src, dest, mode='dijkstra'): # route between two ground locations using the selected search mode
+    src_routing_sat = get_overhead_routing_sat(src)
+    dest_routing_sat = get_overhead_routing_sat(dest)
+    if (src_routing_sat is None) or (dest_routing_sat is None):
+        print(f"Unable to find satellites overhead of source and destination")
+        return None
+    result = find_route_satnums(src_routing_sat.satnum, dest_routing_sat.satnum, mode=mode)
+    if result is None:
+        print(f"Unable to find route using {mode} search")
+        return None
+    print(f"Path has {result.get_hop_count()} hops and distance of {result.distance_km:.2f}km ({result.latency:.2f} seconds); compute time {result.compute_time}; {result.nodes_expanded} nodes expanded ({mode})")
+    return result
+
+def find_route_dijkstra_heap(src, dest):
+    return find_route_engine(src, dest, 'dijkstra')
+
+## :: Shortest Path Trees ::
+class path_tree: # one-to-all shortest paths from a single source satellite
+    def __init__(self, topology, src_row, dist, pred, nodes_expanded):
+        self.topology = topology
+        self.src_row = src_row
+        self.src_satnum = int(topology.satnums[src_row])
+        self.dist_km = np.asarray(dist, dtype=np.float64) # inf for unreachable satellites
+        self.pred = np.asarray(pred, dtype=np.int32) # predecessor row, -1 for the source and unreachable satellites
+        self.nodes_expanded = nodes_expanded
+
+    def get_distance_km(self, dest_satnum):
+        return float(self.dist_km[self.topology.satnum_index[dest_satnum]])
+
+    def get_latency(self, dest_satnum):
+        return self.get_distance_km(dest_satnum) * secs_per_km
+
+    def get_path(self, dest_satnum): # satnum list from the source to dest_satnum, None if unreachable
+        path_rows = retrace_path_rows(self.pred, self.src_row, self.topology.satnum_index[dest_satnum])
+        if path_rows is None:
+            return None
+        return self.topology.satnums[path_rows].tolist()
+
+def shortest_path_tree(src_satnum, topology=None): # single Dijkstra pass with no early exit
+    if topology is None:
+        topology = get_topology_snapshot()
+    src_row = topology.satnum_index[src_satnum]
+    dist, pred, nodes_expanded = dijkstra_rows(topology, src_row)
+    return path_tree(topology, src_row, dist, pred, nodes_expanded)
+
+worker_topology = None # topology_snapshot rebuilt inside each all-pairs worker process
+
+def all_pairs_worker_init(satnums, indptr, indices, lengths_km):
+    global worker_topology
+    worker_topology = topology_snapshot(None, satnums, indptr, indices, lengths_km, None)
+
+def all_pairs_worker(src_rows): # returns (src_rows, latency block, predecessor block) for a chunk of sources
+    return all_pairs_block(worker_topology, src_rows)
+
+def all_pairs_block(topology, src_rows):
+    num_sats = topology.get_num_sats()
+    latency_block = np.empty((len(src_rows), num_sats), dtype=np.float32)
+    pred_block = np.empty((len(src_rows), num_sats), dtype=np.int32)
+    for i, src_row in enumerate(src_rows):
+        dist, pred, _ = dijkstra_rows(topology, src_row)
+        latency_block[i] = np.asarray(dist) * secs_per_km
+        pred_block[i] = pred
+    return src_rows, latency_block, pred_block
+
+def all_pairs_latency(topology=None, src_satnums=None, processes=None, out_path=None):
+    # latency[i, j] in seconds from src_satnums[i] to topology row j, with pred[i, j] the predecessor row of j
+    # writes <out_path>_latency.npy and <out_path>_pred.npy so downstream analysis can np.load(..., mmap_mode='r')
+    if topology is None:
+        topology = get_topology_snapshot()
+    if src_satnums is None:
+        src_rows = list(range(topology.get_num_sats()))
+    else:
+        src_rows = [topology.satnum_index[satnum] for satnum in src_satnums]
+    shape = (len(src_rows), topology.get_num_sats())
+    if out_path is None:
+        latency = np.empty(shape, dtype=np.float32)
+        pred = np.empty(shape, dtype=np.int32)
+    else:
+        latency = np.lib.format.open_memmap(f'{out_path}_latency.npy', mode='w+', dtype=np.float32, shape=shape)
+        pred = np.lib.format.open_memmap(f'{out_path}_pred.npy', mode='w+', dtype=np.int32, shape=shape)
+    row_position = {src_row: i for i, src_row in enumerate(src_rows)}
+    chunks = [src_rows[i:i+all_pairs_chunk_size] for i in range(0, len(src_rows), all_pairs_chunk_size)]
+
+    start = time.time()
+    if processes == 1:
+        blocks = (all_pairs_block(topology, chunk) for chunk in chunks)
+        for chunk, latency_block, pred_block in blocks:
+            positions = [row_position[src_row] for src_row in chunk]
+            latency[positions] = latency_block
+            pred[positions] = pred_block
+    else:
+        if processes is None:
+            processes = os.cpu_count()
+        init_args = (topology.satnums, topology.indptr, topology.indices, topology.lengths_km)
+        with ProcessPoolExecutor(max_workers=processes, initializer=all_pairs_worker_init, initargs=init_args) as executor:
+            for chunk, latency_block, pred_block in executor.map(all_pairs_worker, chunks):
+                positions = [row_position[src_row] for src_row in chunk]
+                latency[positions] = latency_block
+                pred[positions] = pred_block
+    if out_path is not None:
+        latency.flush()
+        pred.flush()
+    print(f'Computed {shape[0]}x{shape[1]} latency matrix in {time.time() - start:.2f} seconds using {processes} processes')
+    return latency, pred
+
+## :: Time-Expanded Routing ::
+# Contact-graph style earliest-arrival search: each timestep contributes one topology layer, and a packet can
+# either cross an ISL that exists in the current layer or wait on its satellite for the next layer (store-and-forward)
+class earliest_arrival_result:
+    def __init__(self, hop_list, arrival_seconds, start_time, layers_built, nodes_expanded, compute_time):
+        self.hop_list = hop_list # [(satnum, step the packet left this satellite)], last entry is the destination
+        self.satnum_list = [satnum for satnum, _ in hop_list]
+        self.arrival_seconds = arrival_seconds # seconds after start_time that the packet reaches the destination
+        self.start_time = start_time
+        self.layers_built = layers_built
+        self.nodes_expanded = nodes_expanded
+        self.compute_time = compute_time
+
+    def get_wait_steps(self): # number of timesteps the packet was stored on a satellite
+        steps = [step for _, step in self.hop_list]
+        return steps[-1] - steps[0]
+
+def iter_topology_layers(start_time, num_steps, step_seconds=time_interval, chunk_steps=simulation_chunk_steps): # lazily yields (step, time, topology)
+    # the window is propagated in chunks over its time grid like run_simulation; chunks start at one step and double,
+    # so a query answered in the first few layers does not pay for a full chunk
+    clock = simulation_clock(start_time, step_seconds=step_seconds, num_steps=num_steps)
+    saved_time = cur_time
+    try:
+        for step in iter_clock_steps(clock, chunk_steps, first_chunk_steps=1):
+            yield step, cur_time, get_topology_snapshot()
+    finally:
+        set_cur_time(saved_time)
+
+def find_earliest_arrival(src_satnum, dest_satnum, start_time=None, window_seconds=86400, step_seconds=time_interval):
+    if start_time is None:
+        start_time = cur_time
+    num_steps = max(1, int(window_seconds // step_seconds))
+    start = time.process_time()
+    arrival = None
+    layers = iter_topology_layers(start_time, num_steps, step_seconds)
+    layers_built = 0
+    nodes_expanded = 0
+    found = False
+    try:
+        for step, _, topology in layers:
+            layers_built += 1
+            if arrival is None:
+                num_sats = topology.get_num_sats()
+                src_row = topology.satnum_index[src_satnum]
+                dest_row = topology.satnum_index[dest_satnum]
+                arrival = [float('inf')] * num_sats # seconds after start_time
+                pred_row = [-1] * num_sats
+                pred_step = [-1] * num_sats
+                arrival[src_row] = 0.0
+                pred_step[src_row] = 0
+                reached_rows = [src_row]
+            layer_start = step * step_seconds
+            layer_end = layer_start + step_seconds
+
+            # every satellite already holding the packet can depart during this layer
+            heap = [(max(arrival[row], layer_start), row) for row in reached_rows if arrival[row] < layer_end]
+            heapq.heapify(heap)
+            settled = set()
+            indptr = topology.indptr_list
+            indices = topology.indices_list
+            lengths = topology.lengths_list
+            while heap:
+                depart_time, cur_row = heapq.heappop(heap)
+                if depart_time >= layer_end:
+                    break # remaining departures belong to the next layer
+                if cur_row in settled:
+                    continue
+                settled.add(cur_row)
+                nodes_expanded += 1
+                if cur_row == dest_row:
+                    break # popped in arrival order, so nothing later in this layer can beat it
+                for k in range(indptr[cur_row], indptr[cur_row+1]):
+                    neighbour_row = indices[k]
+                    arrival_time = depart_time + lengths[k] * secs_per_km
+                    if arrival_time < arrival[neighbour_row]:
+                        if arrival[neighbour_row] == float('inf'):
+                            reached_rows.append(neighbour_row)
+                        arrival[neighbour_row] = arrival_time
+                        pred_row[neighbour_row] = cur_row
+                        pred_step[neighbour_row] = step
+                        heapq.heappush(heap, (arrival_time, neighbour_row))
+            if arrival[dest_row] <= layer_end: # later layers only depart after layer_end
+                found = True
+                break
+    finally:
+        layers.close()
+    compute_time = time.process_time() - start
+    if (not found) and (arrival is not None) and (arrival[dest_row] < float('inf')):
+        found = True # departed inside the window but lands after the last layer_end; still the best arrival there is
+    if not found:
+        print(f"No path from {src_satnum} to {dest_satnum} within {window_seconds} seconds")
+        return None
+
+    hop_list = [(int(topology.satnums[dest_row]), pred_step[dest_row])]
+    cur_row = dest_row
+    while cur_row != src_row:
+        prev_row = pred_row[cur_row]
+        hop_list.insert(0, (int(topology.satnums[prev_row]), pred_step[cur_row]))
+        cur_row = prev_row
+    return earliest_arrival_result(hop_list, arrival[dest_row], start_time, layers_built, nodes_expanded, compute_time)
+
+## :: Incremental Route Maintenance ::
+# Keeps one source's shortest path tree alive across timesteps and repairs it instead of re-running Dijkstra.
+# Only the search gets cheaper: on the 1,584 satellite shell a repair is ~1 ms against ~3 ms for a full Dijkstra, but
+# every step still propagates and rebuilds the topology (~5 ms), so a latency series runs ~1.4x faster end to end
+class dynamic_path_tree:
+    def __init__(self, src_satnum):
+        self.src_satnum = src_satnum
+        self.topology = None
+        self.dist_km = None
+        self.pred = None
+        self.touched_history = [] # nodes touched by each update
+
+    def update(self, topology=None): # call after cur_time advances; returns the number of nodes touched
+        if topology is None:
+            topology = get_topology_snapshot()
+        if (self.dist_km is None) or (topology.get_num_sats() != len(self.dist_km)):
+            src_row = topology.satnum_index[self.src_satnum]
+            dist, pred, touched = dijkstra_rows(topology, src_row)
+            self.dist_km = np.asarray(dist, dtype=np.float64)
+            self.pred = np.asarray(pred, dtype=np.int64)
+        else:
+            touched = self.repair(topology)
+        self.topology = topology
+        self.touched_history.append(touched)
+        return touched
+
+    def repair(self, topology):
+        num_sats = topology.get_num_sats()
+        src_row = topology.satnum_index[self.src_satnum]
+        rows = np.arange(num_sats)
+        pred = self.pred.copy()
+        has_pred = pred >= 0
+
+        # new length of every tree link; inf where the link no longer exists, which orphans that subtree
+        table_rows, table_lengths = topology.get_neighbour_table()
+        edge_km = np.zeros(num_sats)
+        parents = pred[has_pred]
+        match = table_rows[parents] == rows[has_pred][:, np.newaxis]
+        edge_km[has_pred] = np.where(match, table_lengths[parents], np.inf).min(axis=1)
+        base_km = np.full(num_sats, np.inf) # distance of each tree root: 0 for the source, inf for unreached satellites
+        base_km[src_row] = 0.0
+
+        # re-sum distances down the old tree with pointer jumping, O(log depth) vectorized passes
+        acc_km = np.where(has_pred, edge_km, 0.0)
+        jump = np.where(has_pred, pred, rows)
+        while (jump[jump] != jump).any():
+            acc_km = acc_km + acc_km[jump]
+            jump = jump[jump]
+        dist = acc_km + base_km[jump]
+        orphaned = (~np.isfinite(dist)) & np.isfinite(self.dist_km)
+        pred[orphaned] = -1
+
+        # links that now offer a shorter path seed a Dijkstra that only runs over the affected region
+        link_sources = topology.get_link_sources()
+        candidate_km = dist[link_sources] + topology.lengths_km
+        improving = np.nonzero(candidate_km < dist[topology.indices] - 1e-9)[0]
+        dist = dist.tolist()
+        pred = pred.tolist()
+        heap = []
+        for k in improving.tolist():
+            neighbour_row = topology.indices_list[k]
+            if candidate_km[k] < dist[neighbour_row]:
+                dist[neighbour_row] = float(candidate_km[k])
+                pred[neighbour_row] = int(link_sources[k])
+                heapq.heappush(heap, (dist[neighbour_row], neighbour_row))
+        indptr = topology.indptr_list
+        indices = topology.indices_list
+        lengths = topology.lengths_list
+        touched_rows = set(np.nonzero(orphaned)[0].tolist())
+        while heap:
+            cur_dist, cur_row = heapq.heappop(heap)
+            if cur_dist > dist[cur_row]:
+                continue # stale heap entry
+            touched_rows.add(cur_row)
+            for k in range(indptr[cur_row], indptr[cur_row+1]):
+                neighbour_row = indices[k]
+                tentative_dist = cur_dist + lengths[k]
+                if tentative_dist < dist[neighbour_row] - 1e-9:
+                    dist[neighbour_row] = tentative_dist
+                    pred[neighbour_row] = cur_row
+                    heapq.heappush(heap, (tentative_dist, neighbour_row))
+        self.dist_km = np.asarray(dist, dtype=np.float64)
+        self.pred = np.asarray(pred, dtype=np.int64)
+        return len(touched_rows)
+
+    def get_distance_km(self, dest_satnum):
+        return float(self.dist_km[self.topology.satnum_index[dest_satnum]])
+
+    def get_latency(self, dest_satnum):
+        return self.get_distance_km(dest_satnum) * secs_per_km
+
+    def get_path(self, dest_satnum):
+        src_row = self.topology.satnum_index[self.src_satnum]
+        path_rows = retrace_path_rows(self.pred, src_row, self.topology.satnum_index[dest_satnum])
+        if path_rows is None:
+            return None
+        return self.topology.satnums[path_rows].tolist()
+
+def dynamic_latency_series(src_satnum, dest_satnum, start_time=None, num_steps=60, step_seconds=time_interval):
+    # latency (seconds) from src to dest at every step, repairing one tree as time advances; returns (latencies, touched per step)
+    if start_time is None:
+        start_time = cur_time
+    tree = dynamic_path_tree(src_satnum)
+    latencies = []
+    repair_seconds = 0.0
+    start = time.perf_counter()
+    for step, _, topology in iter_topology_layers(start_time, num_steps, step_seconds):
+        repair_start = time.perf_counter()
+        tree.update(topology)
+        repair_seconds += time.perf_counter() - repair_start
+        latencies.append(tree.get_latency(dest_satnum))
+    compute_time = time.perf_counter() - start
+    print(f'Tracked {num_steps} steps from {src_satnum} to {dest_satnum}; mean nodes touched per step after the first: {np.mean(tree.touched_history[1:]) if num_steps > 1 else 0:.1f}; '
+          f'compute time {compute_time:.3f} seconds ({repair_seconds:.3f} repairing the tree, the rest propagating and building topologies)')
+    return latencies, tree.touched_history
+
+def ground_station_latency_matrix(locations, topology=None, out_path=None):
+    # stations x stations latency in seconds between the satellites overhead of each ground location (inf when none is overhead)
+    if topology is None:
+        topology = get_topology_snapshot()
+    station_sats = [get_overhead_routing_sat(location) for location in locations]
+    latency = np.full((len(locations), len(locations)), np.inf, dtype=np.float32)
+    for i, src_sat in enumerate(station_sats):
+        if src_sat is None:
+            continue
+        tree = shortest_path_tree(src_sat.satnum, topology)
+        for j, dest_sat in enumerate(station_sats):
+            if dest_sat is not None:
+                latency[i, j] = tree.get_latency(dest_sat.satnum)
+    if out_path is not None:
+        np.save(out_path, latency)
+    return latency
+
+## :: Sparse Matrix Backend ::
+# Hands the snapshot topology to scipy.sparse.csgraph; the pure-Python searches above remain the reference
+def topology_to_csr_matrix(topology=None): # (N, N) scipy CSR matrix, entry [i, j] is the ISL km from row i to row j
+    if topology is None:
+        topology = get_topology_snapshot()
+    if topology.sparse_matrix is None:
+        num_sats = topology.get_num_sats()
+        topology.sparse_matrix = csr_matrix((topology.lengths_km, topology.indices, topology.indptr), shape=(num_sats, num_sats))
+    return topology.sparse_matrix
+
+def csgraph_dijkstra_rows(topology, src_row): # returns (dist, pred, nodes reached) like dijkstra_rows
+    dist, pred = csgraph.dijkstra(topology_to_csr_matrix(topology), directed=True, indices=src_row, return_predecessors=True)
+    return dist, pred, int(np.isfinite(dist).sum())
+
+def csgraph_shortest_paths(src_satnums=None, topology=None): # (distance km, predecessor row) matrices, one row per source
+    if topology is None:
+        topology = get_topology_snapshot()
+    src_rows = None if src_satnums is None else [topology.satnum_index[satnum] for satnum in src_satnums]
+    return csgraph.dijkstra(topology_to_csr_matrix(topology), directed=True, indices=src_rows, return_predecessors=True)
+
+def csgraph_connected_components(topology=None, connection='strong'): # (number of components, component label per row)
+    if topology is None:
+        topology = get_topology_snapshot()
+    return csgraph.connected_components(topology_to_csr_matrix(topology), directed=True, connection=connection)
+
+def csgraph_hop_counts(src_satnum, topology=None): # ISL hops from src_satnum to every row, inf when unreachable
+    if topology is None:
+        topology = get_topology_snapshot()
+    src_row = topology.satnum_index[src_satnum]
+    return csgraph.shortest_path(topology_to_csr_matrix(topology), method='D', directed=True, unweighted=True, indices=src_row)
+
+def compare_routing_backends(src_satnum, dest_satnum, topology=None): # checks the csgraph backend against the pure-Python search
+    reference = find_route_satnums(src_satnum, dest_satnum, topology, 'dijkstra')
+    candidate = find_route_satnums(src_satnum, dest_satnum, topology, 'csgraph')
+    if (reference is None) or (candidate is None):
+        match = (reference is None) and (candidate is None)
+    else:
+        match = abs(reference.distance_km - candidate.distance_km) < 1e-6
+    print(f"Backends {'agree' if match else 'DISAGREE'} for {src_satnum} -> {dest_satnum}: "
+          f"dijkstra {reference.distance_km if reference else None}km ({reference.compute_time if reference else None}s), "
+          f"csgraph {candidate.distance_km if candidate else None}km ({candidate.compute_time if candidate else None}s)")
+    return match
+
+## :: Flow-Level Traffic Engineering ::
+# Multi-commodity load on the ISLs from a ground-station traffic matrix. Demands are aggregated per (ingress, egress)
+# satellite pair with np.add.at. For each ingress, every satellite's traffic (its own demand plus everything routed
+# through it) is pushed back towards the ingress over the shortest-path DAG, split evenly between equal-cost parents.
+# That is one sparse mat-vec per hop of depth.
+te_modes = ('shortest', 'ecmp', 'minmax')
+
+class traffic_result:
+    def __init__(self, topology, link_load_bps, capacity_bps, routed_bps, unrouted_bps, mode, compute_time, max_utilization_history=None):
+        self.topology = topology
+        self.link_load_bps = link_load_bps # per topology link (CSR order)
+        self.capacity_bps = capacity_bps
+        self.link_utilization = link_load_bps / capacity_bps
+        self.max_utilization = float(self.link_utilization.max()) if len(link_load_bps) > 0 else 0.0
+        self.routed_bps = routed_bps
+        self.unrouted_bps = unrouted_bps # demand whose station had no satellite overhead, or no path
+        self.mode = mode
+        self.compute_time = compute_time
+        self.max_utilization_history = max_utilization_history # per rerouting round, 'minmax' only
+
+    def get_saturated_links(self, threshold=1.0): # [(from satnum, to satnum, utilization)] at or above threshold, busiest first
+        links = np.flatnonzero(self.link_utilization >= threshold)
+        links = links[np.argsort(-self.link_utilization[links])]
+        sources = self.topology.get_link_sources()
+        return [(int(self.topology.satnums[sources[link]]), int(self.topology.satnums[self.topology.indices[link]]), float(self.link_utilization[link])) for link in links]
+
+    def print_summary(self):
+        print(f'Routed {self.routed_bps / 1e9:.2f}Gbps ({self.unrouted_bps / 1e9:.2f}Gbps unrouted) using {self.mode}; '
+              f'max ISL utilization {100 * self.max_utilization:.1f}%, {len(self.get_saturated_links())} saturated links; compute time {self.compute_time}')
+
+def get_station_rows(locations, topology): # topology row of the satellite overhead of each location, -1 when none
+    rows = np.full(len(locations), -1, dtype=np.int64)
+    for i, location in enumerate(locations):
+        r_sat = get_overhead_routing_sat(location)
+        if r_sat is not None:
+            rows[i] = topology.satnum_index[r_sat.satnum]
+    return rows
+
+def get_demand_matrix(traffic_matrix, station_rows, num_sats): # (ingress rows, (ingress, N) bps to each egress row)
+    traffic_matrix = np.asarray(traffic_matrix, dtype=np.float64)
+    src_station, dest_station = np.nonzero(traffic_matrix)
+    bps = traffic_matrix[src_station, dest_station]
+    src_rows = station_rows[src_station]
+    dest_rows = station_rows[dest_station]
+    overhead = (src_rows >= 0) & (dest_rows >= 0)
+    ingress_rows, ingress_index = np.unique(src_rows[overhead], return_inverse=True)
+    demand = np.zeros((len(ingress_rows), num_sats))
+    np.add.at(demand, (ingress_index, dest_rows[overhead]), bps[overhead])
+    return ingress_rows, demand, float(bps[~overhead].sum())
+
+def push_demand_to_links(topology, src_row, dist, demand, weights_km, pred=None, tolerance_km=ecmp_tolerance_km):
+    # per-link load (bps) from one ingress; pred selects the single shortest-path tree, otherwise all near-equal-cost parents
+    num_sats = topology.get_num_sats()
+    sources = topology.get_link_sources()
+    targets = topology.indices
+    if pred is not None:
+        on_dag = pred[targets] == sources
+    else:
+        on_dag = np.isfinite(dist[targets]) & (dist[sources] + weights_km <= dist[targets] + tolerance_km)
+    on_dag &= targets != src_row
+    dag_links = np.flatnonzero(on_dag)
+    share = 1.0 / np.bincount(targets[dag_links], minlength=num_sats)[targets[dag_links]]
+    # through[u] = demand[u] + sum over DAG children v of share * through[v]; iterate to the fixed point (depth of the DAG)
+    pull = csr_matrix((share, (sources[dag_links], targets[dag_links])), shape=(num_sats, num_sats))
+    through = demand.copy()
+    for _ in range(num_sats):
+        updated = demand + pull @ through
+        if np.array_equal(updated, through):
+            break
+        through = updated
+    link_load = np.zeros(len(targets))
+    link_load[dag_links] = share * through[targets[dag_links]]
+    return link_load
+
+def route_traffic(ingress_rows, demand, topology, weights_km, mode):
+    dist, pred = csgraph.dijkstra(csr_matrix((weights_km, topology.indices, topology.indptr), shape=(topology.get_num_sats(),) * 2), directed=True, indices=ingress_rows, return_predecessors=True)
+    link_load = np.zeros(len(topology.indices))
+    unreachable_bps = 0.0
+    for i, src_row in enumerate(ingress_rows):
+        reachable = np.isfinite(dist[i])
+        unreachable_bps += float(demand[i][~reachable].sum())
+        link_load += push_demand_to_links(topology, src_row, dist[i], np.where(reachable, demand[i], 0.0), weights_km, pred[i] if mode == 'shortest' else None)
+    return link_load, unreachable_bps
+
+def compute_link_loads(locations, traffic_matrix, topology=None, mode='shortest', capacity_bps=isl_bandwidth_bps, iterations=te_iterations):
+    # traffic_matrix[i, j] is bps from locations[i] to locations[j]; returns a traffic_result for the snapshot topology
+    if mode not in te_modes:
+        raise ValueError(f"Unknown traffic engineering mode '{mode}', expected one of {te_modes}")
+    if topology is None:
+        topology = get_topology_snapshot()
+    start = time.process_time()
+    station_rows = get_station_rows(locations, topology)
+    ingress_rows, demand, no_overhead_bps = get_demand_matrix(traffic_matrix, station_rows, topology.get_num_sats())
+    history = None
+    if mode == 'minmax':
+        # method of successive averages: reroute everything on utilization-penalized lengths, blend into the running load
+        link_load, unreachable_bps = route_traffic(ingress_rows, demand, topology, topology.lengths_km, 'ecmp')
+        history = [float((link_load / capacity_bps).max())]
+        for round_index in range(2, iterations + 1):
+            weights_km = topology.lengths_km * (1.0 + te_penalty * (link_load / capacity_bps) ** 2)
+            candidate_load, _ = route_traffic(ingress_rows, demand, topology, weights_km, 'ecmp')
+            link_load += (candidate_load - link_load) / round_index
+            history.append(float((link_load / capacity_bps).max()))
+    else:
+        link_load, unreachable_bps = route_traffic(ingress_rows, demand, topology, topology.lengths_km, mode)
+    compute_time = time.process_time() - start
+    unrouted_bps = no_overhead_bps + unreachable_bps
+    # demand between stations sharing one satellite never touches an ISL but still counts as routed
+    routed_bps = float(demand.sum()) - unreachable_bps
+    return traffic_result(topology, link_load, capacity_bps, routed_bps, unrouted_bps, mode, compute_time, history)
+
+## :: Packet Simulation ::
+# Discrete-event packet simulator over the ISL topology. One heap of (time, sequence, event, payload) drives per-flow
+# packet generators, per-ISL drop-tail FIFO queues with a fixed bandwidth, and propagation delay from secs_per_km.
+# Packets are source routed: they keep the ISL path their flow had when they were generated.
+# Ground up/down links are not modelled, a flow starts and ends at the satellites overhead of its two stations
+event_generate, event_transmitted, event_arrive, event_refresh = 0, 1, 2, 3
+
+class packet_flow:
+    def __init__(self, flow_id, src, dest, rate_bps, packet_bytes=packet_size_bytes, start_seconds=0.0, stop_seconds=None, poisson=True):
+        self.flow_id = flow_id
+        self.src = src # ground locations
+        self.dest = dest
+        self.rate_bps = rate_bps
+        self.packet_bits = packet_bytes * 8
+        self.interval_seconds = self.packet_bits / rate_bps # mean time between packets
+        self.start_seconds = start_seconds
+        self.stop_seconds = stop_seconds # None: until the end of the run
+        self.poisson = poisson # exponential inter-arrival times instead of a constant bit rate
+        self.satnum_path = None # current route, None while either station has no satellite overhead
+        self.link_path = None # ISL ids along satnum_path
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0 # tail drops at a full ISL queue
+        self.unroutable = 0 # generated while the flow had no route
+        self.delivered_bits = 0
+        self.delays = [] # end-to-end seconds of each delivered packet
+        self.queue_delays = [] # seconds each delivered packet spent waiting in ISL queues
+
+class packet_simulator:
+    def __init__(self, bandwidth_bps=isl_bandwidth_bps, queue_packets=isl_queue_packets, mode='dijkstra', seed=None):
+        self.bandwidth_bps = bandwidth_bps
+        self.queue_packets = queue_packets
+        self.mode = mode # routing engine passed to find_route_satnums
+        self.random = random.Random(seed)
+        self.flows = []
+        # per-ISL state, indexed by link id; (from satnum, to satnum) pairs keep their id across topology refreshes
+        self.link_ids = {}
+        self.link_ends = []
+        self.link_delay = [] # propagation seconds
+        self.link_queues = [] # deque of packets, head is the one being transmitted
+        self.link_busy_seconds = []
+        self.link_max_queue = []
+
+    def add_flow(self, src, dest, rate_bps, packet_bytes=packet_size_bytes, start_seconds=0.0, stop_seconds=None, poisson=True):
+        flow = packet_flow(len(self.flows), src, dest, rate_bps, packet_bytes, start_seconds, stop_seconds, poisson)
+        self.flows.append(flow)
+        return flow
+
+    def get_link_id(self, from_satnum, to_satnum):
+        link = self.link_ids.get((from_satnum, to_satnum))
+        if link is None:
+            link = len(self.link_ends)
+            self.link_ids[(from_satnum, to_satnum)] = link
+            self.link_ends.append((from_satnum, to_satnum))
+            self.link_delay.append(0.0)
+            self.link_queues.append(deque())
+            self.link_busy_seconds.append(0.0)
+            self.link_max_queue.append(0)
+        return link
+
+    def refresh_routes(self, topology): # re-select ingress satellites and routes for every flow at cur_time
+        for flow in self.flows:
+            flow.satnum_path = None
+            flow.link_path = None
+            src_routing_sat = get_overhead_routing_sat(flow.src)
+            dest_routing_sat = get_overhead_routing_sat(flow.dest)
+            if (src_routing_sat is None) or (dest_routing_sat is None):
+                continue
+            route = find_route_satnums(src_routing_sat.satnum, dest_routing_sat.satnum, topology, self.mode)
+            if route is None:
+                continue
+            flow.satnum_path = route.satnum_list
+            link_path = []
+            for from_satnum, to_satnum in zip(route.satnum_list[:-1], route.satnum_list[1:]):
+                link = self.get_link_id(from_satnum, to_satnum)
+                neighbour_rows, lengths_km = topology.get_neighbours(topology.satnum_index[from_satnum])
+                self.link_delay[link] = float(lengths_km[list(neighbour_rows).index(topology.satnum_index[to_satnum])]) * secs_per_km
+                link_path.append(link)
+            flow.link_path = tuple(link_path)
+
+    def run(self, duration_seconds, start_time=None, refresh_seconds=None, verbose=True):
+        # simulates duration_seconds of traffic starting at start_time; routes are recomputed every refresh_seconds
+        if start_time is None:
+            start_time = cur_time
+        saved_time = cur_time
+        heappush, heappop = heapq.heappush, heapq.heappop
+        random_expovariate = self.random.expovariate
+        bandwidth_bps = self.bandwidth_bps
+        queue_packets = self.queue_packets
+        link_delay = self.link_delay
+        link_queues = self.link_queues
+        link_busy_seconds = self.link_busy_seconds
+        link_max_queue = self.link_max_queue
+        heap = []
+        sequence = 0
+        events = 0
+
+        start = time.process_time()
+        try:
+            set_cur_time(start_time)
+            self.refresh_routes(get_topology_snapshot())
+            for flow in self.flows:
+                if flow.start_seconds < duration_seconds:
+                    heappush(heap, (flow.start_seconds, sequence, event_generate, flow))
+                    sequence += 1
+            if refresh_seconds is not None:
+                heappush(heap, (refresh_seconds, sequence, event_refresh, None))
+                sequence += 1
+
+            while heap:
+                now, _, event, payload = heappop(heap)
+                if now > duration_seconds:
+                    break
+                events += 1
+                if event == event_arrive: # packet = [flow, link path, hop, created, enqueued, queue wait]
+                    packet = payload
+                    hop = packet[2] + 1
+                    link_path = packet[1]
+                    if hop == len(link_path):
+                        flow = packet[0]
+                        flow.delivered += 1
+                        flow.delivered_bits += flow.packet_bits
+                        flow.delays.append(now - packet[3])
+                        flow.queue_delays.append(packet[5])
+                        continue
+                    packet[2] = hop
+                    link = link_path[hop]
+                elif event == event_transmitted: # head of the link queue has left, start the next one
+                    link = payload
+                    queue = link_queues[link]
+                    packet = queue.popleft()
+                    heappush(heap, (now + link_delay[link], sequence, event_arrive, packet))
+                    sequence += 1
+                    if queue:
+                        head = queue[0]
+                        head[5] += now - head[4]
+                        tx_seconds = head[0].packet_bits / bandwidth_bps
+                        link_busy_seconds[link] += tx_seconds
+                        heappush(heap, (now + tx_seconds, sequence, event_transmitted, link))
+                        sequence += 1
+                    continue
+                elif event == event_generate:
+                    flow = payload
+                    gap = random_expovariate(1.0 / flow.interval_seconds) if flow.poisson else flow.interval_seconds
+                    if (flow.stop_seconds is None) or (now + gap < flow.stop_seconds):
+                        heappush(heap, (now + gap, sequence, event_generate, flow))
+                        sequence += 1
+                    flow.sent += 1
+                    link_path = flow.link_path
+                    if link_path is None:
+                        flow.unroutable += 1
+                        continue
+                    if len(link_path) == 0: # both stations share one satellite
+                        flow.delivered += 1
+                        flow.delivered_bits += flow.packet_bits
+                        flow.delays.append(0.0)
+                        flow.queue_delays.append(0.0)
+                        continue
+                    packet = [flow, link_path, 0, now, now, 0.0]
+                    link = link_path[0]
+                else: # event_refresh
+                    set_cur_time(start_time + now / DAY_S)
+                    self.refresh_routes(get_topology_snapshot())
+                    heappush(heap, (now + refresh_seconds, sequence, event_refresh, None))
+                    sequence += 1
+                    continue
+
+                # enqueue packet on link; transmit immediately if the link is idle
+                queue = link_queues[link]
+                if len(queue) >= queue_packets:
+                    packet[0].dropped += 1
+                    continue
+                packet[4] = now
+                queue.append(packet)
+                if len(queue) > link_max_queue[link]:
+                    link_max_queue[link] = len(queue)
+                if len(queue) == 1:
+                    tx_seconds = packet[0].packet_bits / bandwidth_bps
+                    link_busy_seconds[link] += tx_seconds
+                    heappush(heap, (now + tx_seconds, sequence, event_transmitted, link))
+                    sequence += 1
+        finally:
+            set_cur_time(saved_time)
+        compute_time = time.process_time() - start
+        result = packet_sim_result(self, duration_seconds, events, compute_time)
+        if verbose:
+            result.print_summary()
+        return result
+
+class packet_sim_result:
+    def __init__(self, simulator, duration_seconds, events, compute_time):
+        self.flows = simulator.flows
+        self.link_ends = list(simulator.link_ends) # (from satnum, to satnum) per link id
+        self.duration_seconds = duration_seconds
+        self.events = events
+        self.compute_time = compute_time
+        self.link_utilization = np.minimum(np.array(simulator.link_busy_seconds) / duration_seconds, 1.0)
+        self.link_max_queue = np.array(simulator.link_max_queue, dtype=np.int64)
+
+    def get_throughput_bps(self, flow):
+        return flow.delivered_bits / self.duration_seconds
+
+    def get_loss_rate(self, flow): # tail drops and unroutable packets over packets sent
+        return (flow.dropped + flow.unroutable) / flow.sent if flow.sent > 0 else 0.0
+
+    def get_mean_delay(self, flow):
+        return float(np.mean(flow.delays)) if flow.delays else float('nan')
+
+    def get_mean_queue_delay(self, flow):
+        return float(np.mean(flow.queue_delays)) if flow.queue_delays else float('nan')
+
+    def print_summary(self):
+        print(f'Simulated {self.events} packet events over {self.duration_seconds}s in {self.compute_time:.2f} seconds ({self.events / max(self.compute_time, 1e-9):.0f} events per second)')
+        for flow in self.flows:
+            print(f'\tflow {flow.flow_id}: {self.get_throughput_bps(flow) / 1e6:.2f}Mbps delivered, {100 * self.get_loss_rate(flow):.2f}% lost, mean delay {1000 * self.get_mean_delay(flow):.3f}ms (queueing {1000 * self.get_mean_queue_delay(flow):.3f}ms)')
+        if len(self.link_utilization) > 0:
+            print(f'\tbusiest ISL {self.link_ends[int(np.argmax(self.link_utilization))]} at {100 * self.link_utilization.max():.1f}% utilization')
+
+## :: Simulation Clock ::
+# Fixed-step simulation over a pre-built time grid. Propagation and geodetic conversion run for a whole chunk of
+# timesteps at once; topology and routing then run step by step off the cached snapshots. Every stage is timed.
+simulation_stages = ('propagate', 'geodetic', 'topology', 'ingress', 'routing')
+
+def get_time_grid(start_time, num_steps, step_seconds=time_interval): # one vectorized skyfield Time for the whole run
+    calendar = start_time.utc
+    seconds = calendar.second + np.arange(num_steps) * step_seconds
+    return start_time.ts.utc(calendar.year, calendar.month, calendar.day, calendar.hour, calendar.minute, seconds)
+
+class simulation_clock:
+    def __init__(self, start_time, stop_time=None, step_seconds=time_interval, num_steps=None):
+        # stop_time is inclusive when it falls on a step; num_steps, when given, replaces stop_time
+        self.step_seconds = step_seconds
+        if num_steps is None:
+            num_steps = int(floor((stop_time - start_time) * DAY_S / step_seconds + 1e-6)) + 1
+        self.num_steps = num_steps
+        self.times = get_time_grid(start_time, self.num_steps, step_seconds)
+        self.step = 0
+
+    def __len__(self):
+        return self.num_steps
+
+    def get_time(self, step):
+        return self.times[step]
+
+    def get_seconds(self): # seconds since the start of the run, one per step
+        return np.arange(self.num_steps) * self.step_seconds
+
+    def get_chunks(self, chunk_steps=simulation_chunk_steps, first_chunk_steps=None): # (first step, Time array) slices of the grid
+        # first_chunk_steps: start with chunks this long and double up to chunk_steps, for callers that may stop early
+        size = chunk_steps if first_chunk_steps is None else max(1, min(first_chunk_steps, chunk_steps))
+        first = 0
+        while first < self.num_steps:
+            yield first, self.times[first:first + size]
+            first += size
+            size = min(2 * size, chunk_steps)
+
+    def advance(self): # move cur_time to the next step; returns False once the run is over
+        if self.step + 1 >= self.num_steps:
+            return False
+        self.step += 1
+        set_cur_time(self.get_time(self.step))
+        return True
+
+class simulation_result:
+    def __init__(self, clock, mode):
+        self.clock = clock
+        self.mode = mode
+        self.seconds = clock.get_seconds()
+        self.distance_km = np.full(clock.num_steps, np.inf) # inf when no route (or no overhead satellite) at that step
+        self.hop_count = np.zeros(clock.num_steps, dtype=np.int32)
+        self.routes = [None] * clock.num_steps # satnum list per step
+        self.stage_seconds = {stage: 0.0 for stage in simulation_stages}
+
+    def get_latency(self): # seconds of propagation delay per step
+        return self.distance_km * secs_per_km
+
+    def get_total_seconds(self):
+        return sum(self.stage_seconds.values())
+
+    def print_timing(self):
+        total = self.get_total_seconds()
+        print(f'Simulated {self.clock.num_steps} steps of {self.clock.step_seconds}s in {total:.2f} seconds ({1000 * total / self.clock.num_steps:.3f}ms per step)')
+        for stage in simulation_stages:
+            print(f'\t{stage}: {self.stage_seconds[stage]:.2f} seconds ({100 * self.stage_seconds[stage] / total if total > 0 else 0:.1f}%)')
+
+def iter_clock_steps(clock, chunk_steps=simulation_chunk_steps, ephemeris=None, ephemeris_first_step=0, stage_seconds=None, first_chunk_steps=None):
+    # moves cur_time along the clock's grid and yields each step. Up to chunk_steps timesteps are propagated (or read
+    # from the ephemeris cache) in one call and each step's snapshot is cached before cur_time reaches it, so nothing is
+    # propagated twice. The caller restores cur_time; stage_seconds, when given, collects propagate/geodetic time
+    for first, times in clock.get_chunks(chunk_steps, first_chunk_steps):
+        start = time.perf_counter()
+        if ephemeris is None:
+            chunk_state = get_propagator().propagate(times)
+        else:
+            chunk_state = ephemeris.get_state(ephemeris_first_step + first, times)
+        propagate_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        lat, lon, height = itrs_to_geodetic(chunk_state.itrs_r)
+        arg_lat = get_argument_of_latitude_degrees(chunk_state.teme_r, chunk_state.teme_v) # for the neighbour resolver
+        if stage_seconds is not None:
+            stage_seconds['propagate'] += propagate_seconds
+            stage_seconds['geodetic'] += time.perf_counter() - start
+
+        for i in range(len(times)):
+            clock.step = first + i
+            # slice this step out of the batch
+            state = constellation_state(times[i], chunk_state.satnum_index, chunk_state.teme_r[i], chunk_state.teme_v[i], chunk_state.itrs_r[i], chunk_state.itrs_v[i], chunk_state.errors[i])
+            sat_snapshot_cache.put(constellation_snapshot(state, (lat[i], lon[i], height[i]), arg_lat[i]))
+            set_cur_time(times[i])
+            yield clock.step
+
+def run_simulation(src, dest, start_time=None, stop_time=None, step_seconds=time_interval, mode='dijkstra', chunk_steps=simulation_chunk_steps, verbose=True, num_steps=None, ephemeris=None, ephemeris_first_step=0):
+    # routes src -> dest (ground locations) at every step from start_time to stop_time (default one day); returns a simulation_result
+    # ephemeris: an ephemeris_cache whose grid contains this run, starting at step ephemeris_first_step of the cache
+    if start_time is None:
+        start_time = cur_time
+    if (stop_time is None) and (num_steps is None):
+        stop_time = start_time + 1.0
+    clock = simulation_clock(start_time, stop_time, step_seconds, num_steps)
+    if (ephemeris is None) and use_ephemeris_cache:
+        ephemeris = open_ephemeris_cache(clock)
+    result = simulation_result(clock, mode)
+    stage_seconds = result.stage_seconds
+    saved_time = cur_time
+    try:
+        for step in iter_clock_steps(clock, chunk_steps, ephemeris, ephemeris_first_step, stage_seconds):
+            start = time.perf_counter()
+            topology = get_topology_snapshot()
+            stage_seconds['topology'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            src_routing_sat = get_overhead_routing_sat(src)
+            dest_routing_sat = get_overhead_routing_sat(dest)
+            stage_seconds['ingress'] += time.perf_counter() - start
+            if (src_routing_sat is None) or (dest_routing_sat is None):
+                continue
+
+            start = time.perf_counter()
+            route = find_route_satnums(src_routing_sat.satnum, dest_routing_sat.satnum, topology, mode)
+            stage_seconds['routing'] += time.perf_counter() - start
+            if route is not None:
+                result.distance_km[step] = route.distance_km
+                result.hop_count[step] = route.get_hop_count()
+                result.routes[step] = route.satnum_list
+    finally:
+        set_cur_time(saved_time)
+    if verbose:
+        result.print_timing()
+    return result
+
+## :: Ephemeris Cache ::
+# TEME positions (and velocities, which the neighbour resolver needs for the orbit plane) of the whole constellation
+# over a time grid, stored as float32 (T, N, 3) .npy files and memory-mapped on later runs, so repeat runs over the
+# same constellation and day skip SGP4 and only page in the chunks they touch. ITRS comes from the GMST rotation.
+class ephemeris_cache:
+    def __init__(self, path, satnum_index):
+        self.path = path
+        self.satnum_index = satnum_index
+        self.teme_r = np.load(os.path.join(path, 'teme_r.npy'), mmap_mode='r') # km, float32 (T, N, 3)
+        self.teme_v = np.load(os.path.join(path, 'teme_v.npy'), mmap_mode='r') # km/s
+
+    def __len__(self):
+        return self.teme_r.shape[0]
+
+    def get_state(self, first_step, times): # constellation_state for len(times) grid steps starting at first_step
+        last_step = first_step + len(times)
+        teme_r = self.teme_r[first_step:last_step].astype(np.float64)
+        teme_v = self.teme_v[first_step:last_step].astype(np.float64)
+        whole, _, ut1_fraction = get_sgp4_time_split(times)
+        itrs_r, itrs_v = teme_to_itrs(teme_r, teme_v, whole, ut1_fraction)
+        errors = np.isnan(teme_r[..., 0]).astype(np.uint8) # SGP4 failures are stored as NaN positions, error code 1 here
+        return constellation_state(times, self.satnum_index, teme_r, teme_v, itrs_r, itrs_v, errors)
+
+ephemeris_element_fields = ('jdsatepoch', 'jdsatepochF', 'bstar', 'ndot', 'nddot', 'ecco', 'argpo', 'inclo', 'mo', 'no_kozai', 'nodeo')
+
+def get_ephemeris_key(clock, satrec_list): # hash of the propagated elements, satellite rows and time grid
+    # the elements themselves are hashed, so a constellation file or catalog that reuses the same satnums with different
+    # elements never picks up a stale cache
+    digest = hashlib.sha256()
+    grid = (float(clock.times.whole[0]), float(clock.times.tai_fraction[0]), clock.step_seconds, clock.num_steps)
+    digest.update(repr(grid).encode())
+    digest.update(np.array([satrec.satnum for satrec in satrec_list], dtype=np.int64).tobytes())
+    elements = np.array([[getattr(satrec, field) for field in ephemeris_element_fields] for satrec in satrec_list], dtype=np.float64)
+    digest.update(elements.tobytes())
+    return digest.hexdigest()[:32]
+
+def open_ephemeris_cache(clock, cache_dir=None, chunk_steps=simulation_chunk_steps):
+    # memory-maps the cache for this constellation and clock, propagating and writing it first if it does not exist yet
+    if cache_dir is None:
+        cache_dir = ephemeris_cache_dir
+    propagator = get_propagator()
+    path = os.path.join(cache_dir, get_ephemeris_key(clock, propagator.satrec_list))
+    if not os.path.isdir(path):
+        start = time.time()
+        partial_path = f'{path}.partial{os.getpid()}' # renamed into place once complete, so readers never see half a cache
+        os.makedirs(partial_path, exist_ok=True)
+        shape = (clock.num_steps, len(propagator.satnums), 3)
+        teme_r = np.lib.format.open_memmap(os.path.join(partial_path, 'teme_r.npy'), mode='w+', dtype=np.float32, shape=shape)
+        teme_v = np.lib.format.open_memmap(os.path.join(partial_path, 'teme_v.npy'), mode='w+', dtype=np.float32, shape=shape)
+        for first, times in clock.get_chunks(chunk_steps):
+            state = propagator.propagate(times)
+            teme_r[first:first + len(times)] = state.teme_r
+            teme_v[first:first + len(times)] = state.teme_v
+        teme_r.flush()
+        teme_v.flush()
+        del teme_r, teme_v
+        try:
+            os.rename(partial_path, path)
+        except OSError: # another process finished the same cache first
+            shutil.rmtree(partial_path, ignore_errors=True)
+        print(f'Wrote ephemeris cache {path} ({shape[0]} steps x {shape[1]} satellites) in {time.time() - start:.2f} seconds')
+    return ephemeris_cache(path, propagator.satnum_index)
+
+## :: Parallel Simulation ::
+# Timesteps are independent once the constellation exists, so the grid is cut into contiguous slices and each worker
+# process loads the parent's constellation (synthetic shell, constellation file or real catalog) from a temporary
+# constellation file and runs run_simulation over its slices
+parallel_slices_per_process = 4 # slices handed out per worker, so uneven slices still balance across the pool
+worker_route_args = None # (src, dest, mode) inside each parallel simulation worker
+worker_ephemeris = None # ephemeris_cache opened by a worker, reused across its slices
+
+def parallel_worker_init(constellation_file_path, src_lat_lon_m, dest_lat_lon_m, mode):
+    global worker_route_args
+    load_constellation(constellation_file_path, verbose=False) # same satellites, elements and row order as the parent
+    get_propagator()
+    worker_route_args = (wgs84.latlon(*src_lat_lon_m), wgs84.latlon(*dest_lat_lon_m), mode)
+
+def parallel_worker(task): # (first step, distance km, hop count, routes, stage seconds) for one slice of the grid
+    global worker_ephemeris
+    calendar, first_step, num_steps, step_seconds, ephemeris_path = task
+    src, dest, mode = worker_route_args
+    year, month, day, hour, minute, second = calendar
+    start_time = time_scale.utc(year, month, day, hour, minute, second + first_step * step_seconds)
+    ephemeris = None
+    if ephemeris_path is not None:
+        if (worker_ephemeris is None) or (worker_ephemeris.path != ephemeris_path):
+            worker_ephemeris = ephemeris_cache(ephemeris_path, get_propagator().satnum_index)
+        ephemeris = worker_ephemeris
+    result = run_simulation(src, dest, start_time, step_seconds=step_seconds, mode=mode, verbose=False, num_steps=num_steps, ephemeris=ephemeris, ephemeris_first_step=first_step)
+    return first_step, result.distance_km, result.hop_count, result.routes, result.stage_seconds
+
+def get_lat_lon_m(location): # picklable (latitude degrees, longitude degrees, elevation m) of a wgs84 location
+    return (location.latitude.degrees, location.longitude.degrees, location.elevation.m)
+
+def run_parallel_simulation(src, dest, start_time=None, stop_time=None, step_seconds=time_interval, mode='dijkstra', processes=None, verbose=True):
+    # run_simulation split across a process pool; slices are merged back in timestamp order into one simulation_result
+    if start_time is None:
+        start_time = cur_time
+    if stop_time is None:
+        stop_time = start_time + 1.0
+    if processes is None:
+        processes = os.cpu_count()
+    clock = simulation_clock(start_time, stop_time, step_seconds)
+    result = simulation_result(clock, mode)
+    ephemeris_path = open_ephemeris_cache(clock).path if use_ephemeris_cache else None # built once, shared by every worker
+    num_slices = min(clock.num_steps, processes * parallel_slices_per_process)
+    bounds = np.linspace(0, clock.num_steps, num_slices + 1).astype(np.int64)
+    calendar = tuple(float(value) for value in start_time.utc)
+    tasks = [(calendar, int(bounds[i]), int(bounds[i+1] - bounds[i]), step_seconds, ephemeris_path) for i in range(num_slices)]
+
+    start = time.time()
+    constellation_file, constellation_file_path = tempfile.mkstemp(suffix='.orbc', prefix='parallel_constellation_')
+    os.close(constellation_file)
+    try:
+        save_constellation(constellation_file_path)
+        init_args = (constellation_file_path, get_lat_lon_m(src), get_lat_lon_m(dest), mode)
+        with ProcessPoolExecutor(max_workers=processes, initializer=parallel_worker_init, initargs=init_args) as executor:
+            slices = sorted(executor.map(parallel_worker, tasks), key=lambda worker_slice: worker_slice[0])
+    finally:
+        os.remove(constellation_file_path)
+    for first_step, distance_km, hop_count, routes, stage_seconds in slices:
+        last_step = first_step + len(distance_km)
+        result.distance_km[first_step:last_step] = distance_km
+        result.hop_count[first_step:last_step] = hop_count
+        result.routes[first_step:last_step] = routes
+        for stage, seconds in stage_seconds.items():
+            result.stage_seconds[stage] += seconds # summed over workers, i.e. CPU seconds rather than wall time
+    if verbose:
+        print(f'Simulated {clock.num_steps} steps in {time.time() - start:.2f} seconds using {processes} processes')
+        result.print_timing()
+    return result
+
+## :: Constellation File ::
+# Fixed-width binary records, one per satellite: SGP4 mean elements plus the routing_sat plane/slot/neighbour fields.
+# Loading is one np.fromfile; Satrec objects are only built when the propagator first asks for them, and skyfield
+# EarthSatellite objects only for the legacy per-satellite code paths that touch routing_sat.sat
+constellation_file_magic = b'ORBCONST'
+constellation_file_version = 1
+constellation_record_dtype = np.dtype([
+    ('satnum', np.int64), ('name', 'S24'), ('classification', 'S1'), ('elnum', np.int32), ('revnum', np.int32),
+    ('epoch', np.float64), ('bstar', np.float64), ('ndot', np.float64), ('nddot', np.float64), ('ecco', np.float64),
+    ('argpo', np.float64), ('inclo', np.float64), ('mo', np.float64), ('no_kozai', np.float64), ('nodeo', np.float64),
+    ('orbit_number', np.int32), ('sat_index', np.int32), ('orbit_number_East', np.int32), ('orbit_number_West', np.int32),
+    ('sat_index_North', np.int32), ('sat_index_South', np.int32)])
+constellation_header_dtype = np.dtype([('magic', 'S8'), ('version', np.uint32), ('record_size', np.uint32)])
+sgp4_epoch_jd = 2433281.5 # 1949 December 31 00:00 UT, the zero of the sgp4init epoch argument
+
+class constellation_records: # loaded records plus the Satrec objects, built together on first use
+    def __init__(self, records):
+        self.records = records
+        self.names = [name.decode() or None for name in records['name'].tolist()]
+        self.satrecs = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_satrecs(self): # every row's Satrec, built in one pass over the element columns
+        if self.satrecs is None:
+            self.satrecs = get_satrecs_from_records(self.records)
+        return self.satrecs
+
+    def get_satrec(self, row):
+        return self.get_satrecs()[row]
+
+    def get_catalog_fields(self, row):
+        record = self.records[row]
+        return record['classification'].decode() or 'U', int(record['elnum']), int(record['revnum'])
+
+class record_routing_sat(routing_sat): # routing_sat backed by a row of a loaded constellation file
+    def __init__(self, file_records, row, satnum, orbit_number, sat_index, orbit_number_East, orbit_number_West, sat_index_North, sat_index_South):
+        self.file_records = file_records
+        self.row = row
+        super().__init__(None, satnum, orbit_number, sat_index, orbit_number_East, orbit_number_West, sat_index_North, sat_index_South)
+
+    @property
+    def sat(self): # skyfield EarthSatellite, built on first use
+        if self.earth_sat is None:
+            satrec = self.get_satrec()
+            satrec.classification, satrec.elnum, satrec.revnum = self.get_catalog_fields()
+            self.earth_sat = EarthSatellite.from_satrec(satrec, time_scale)
+            name = self.get_name()
+            if name is not None:
+                self.earth_sat.name = name
+        return self.earth_sat
+
+    @sat.setter
+    def sat(self, earth_sat): # routing_sat.__init__ stores None here until the first use
+        self.earth_sat = earth_sat
+
+    def get_satrec(self):
+        return self.file_records.get_satrec(self.row)
+
+    def get_name(self):
+        return self.file_records.names[self.row]
+
+    def get_catalog_fields(self):
+        return self.file_records.get_catalog_fields(self.row)
+
+def get_satrecs_from_records(records):
+    # sgp4 can only fill a SatrecArray from initialized Satrec objects, so this is one C sgp4init per row and nothing
+    # else; the catalog-only fields (classification, elnum, revnum) stay in the records until an EarthSatellite needs them
+    satrecs = [Satrec() for _ in range(len(records))]
+    columns = [records[field].tolist() for field in ('satnum', 'epoch', 'bstar', 'ndot', 'nddot', 'ecco', 'argpo', 'inclo', 'mo', 'no_kozai', 'nodeo')]
+    for satrec, satnum, epoch, bstar, ndot, nddot, ecco, argpo, inclo, mo, no_kozai, nodeo in zip(satrecs, *columns):
+        satrec.sgp4init(WGS72, 'i', satnum, epoch, bstar, ndot, nddot, ecco, argpo, inclo, mo, no_kozai, nodeo)
+    return satrecs
+
+def save_constellation(path, sat_list=None): # writes every routing_sat (default: the registry) as one record each
+    if sat_list is None:
+        sat_list = list(sat_registry)
+    records = np.zeros(len(sat_list), dtype=constellation_record_dtype)
+    for row, r_sat in enumerate(sat_list):
+        satrec = r_sat.get_satrec()
+        name = r_sat.get_name()
+        classification, elnum, revnum = r_sat.get_catalog_fields()
+        records[row] = (r_sat.satnum, (name or '').encode()[:24], (classification or 'U').encode()[:1], elnum, revnum,
+                        (satrec.jdsatepoch - sgp4_epoch_jd) + satrec.jdsatepochF, satrec.bstar, satrec.ndot, satrec.nddot, satrec.ecco,
+                        satrec.argpo, satrec.inclo, satrec.mo, satrec.no_kozai, satrec.nodeo,
+                        r_sat.orbit_number, r_sat.sat_index, r_sat.orbit_number_East, r_sat.orbit_number_West, r_sat.sat_index_North, r_sat.sat_index_South)
+    header = np.array([(constellation_file_magic, constellation_file_version, constellation_record_dtype.itemsize)], dtype=constellation_header_dtype)
+    with open(path, 'wb') as constellation_file:
+        header.tofile(constellation_file)
+        records.tofile(constellation_file)
+    return records
+
+def read_constellation_records(path): # structured array of records, validated against the header
+    header = np.fromfile(path, dtype=constellation_header_dtype, count=1)
+    if (len(header) == 0) or (header['magic'][0] != constellation_file_magic):
+        raise ValueError(f'{path} is not a constellation file')
+    if (header['version'][0] != constellation_file_version) or (header['record_size'][0] != constellation_record_dtype.itemsize):
+        raise ValueError(f"{path} has record format {header['version'][0]} ({header['record_size'][0]} bytes), expected {constellation_file_version} ({constellation_record_dtype.itemsize} bytes)")
+    return np.fromfile(path, dtype=constellation_record_dtype, offset=constellation_header_dtype.itemsize)
+
+def load_constellation(path, verbose=True): # replaces the current constellation with the one in a constellation file
+    global time_scale, num_sats
+    start = time.time()
+    if time_scale == 0:
+        time_scale = load.timescale()
+    records = read_constellation_records(path)
+    file_records = constellation_records(records)
+    reset_constellation()
+    columns = [records[field].tolist() for field in ('satnum', 'orbit_number', 'sat_index', 'orbit_number_East', 'orbit_number_West', 'sat_index_North', 'sat_index_South')]
+    sat_registry.extend([record_routing_sat(file_records, row, *fields) for row, fields in enumerate(zip(*columns))], file_records)
+    num_sats = len(records)
+    if verbose:
+        print(f'Loaded {num_sats} satellites from {path} in {time.time() - start:.2f} seconds')
+    return records
+
+def get_orbit_list(): # per-plane EarthSatellite lists in sat_index order, rebuilt from the registry after load_constellation
+    if (len(orbit_list) == 0) and (len(sat_registry) > 0):
+        for orbit_number in sorted(sat_registry.orbits):
+            orbit_list.append([r_sat.sat for r_sat in sat_registry.get_orbit(orbit_number)])
+    return orbit_list
+
+def reset_constellation(): # forget every satellite so build_constellation can run again in this process
+    global cur_snapshot
+    del orbit_list[:]
+    sat_registry.clear()
+    sat_snapshot_cache.invalidate()
+    cur_snapshot = None
+
+def build_constellation(tle_path=seed_tle_path, verbose=True): # synthetic shell cloned from the seed TLE; returns the source satellite
+    global time_scale, num_sats
     time_scale = load.timescale()
     #tle_path = '/home/alexk1/Documents/satellite_data/starlink_9MAY23.txt'
     #tle_path = '/home/alexk1/Documents/satellite_data/STARLINK-1071.txt'
-    tle_path = './STARLINK-1071.txt'
     #starlink_url = 'https://celestrak.org/NORAD/elements/gp.php?GROUP=starlink&FORMAT=tle'   
 
     satellites = load.tle_file(tle_path)
-    print('Loaded', len(satellites), 'satellites')
     source_sat = satellites[0]
-
-    print(f'Source satellite epoch: {source_sat.epoch.utc_jpl()}')
+    if verbose:
+        print('Loaded', len(satellites), 'satellites')
+        print(f'Source satellite epoch: {source_sat.epoch.utc_jpl()}')
 
     
 
@@ -998,13 +3055,190 @@ def main ():
             orbit.append(sat)
 
             new_sat = routing_sat(sat, satnum, orbit_index, sat_index, (orbit_index + 1) % orbit_cnt, (orbit_index - 1) % orbit_cnt, (sat_index + 1) % sats_per_orbit, (sat_index - 1) % sats_per_orbit)
-            sat_object_list.append(new_sat)
+            sat_registry.add(new_sat)
             satnum += 1
         
         orbit_list.append(orbit)
 
     num_sats = orbit_cnt * sats_per_orbit
-    print(f'Orbit list has {len(orbit_list)} orbits')
+    if verbose:
+        print(f'Orbit list has {len(orbit_list)} orbits')
+    return source_sat
+
+## :: Catalog Constellation ::
+# Routing grid built from a real catalog instead of the synthetic shell. Satellites are split into shells on mean
+# inclination and each shell into planes on RAAN, both by sorting and cutting wherever the gap between neighbouring
+# values exceeds the tolerance, so the clustering is O(N log N). TLE epochs in a catalog span days and J2 moves a
+# Starlink node by ~4.5 degrees a day, so every RAAN is first carried to one reference time with its secular node rate.
+# Each plane is ordered by argument of latitude at the reference time (sat_index, North/South slots); East/West are the
+# adjacent planes of the same shell in RAAN order, wrapping around only when the shell covers the whole equator
+class plane_assignment:
+    def __init__(self, satnums, orbit_number, sat_index, plane_sizes, plane_East, plane_West, plane_shell, plane_inclination, plane_raan, reference_time=None):
+        self.satnums = satnums # per input row
+        self.orbit_number = orbit_number # per input row, -1 for satellites left out of the grid
+        self.sat_index = sat_index # per input row, position in the plane ordered by argument of latitude, -1 when left out
+        self.plane_sizes = plane_sizes # per plane
+        self.plane_East = plane_East # per plane, -1 at the edge of a partial shell
+        self.plane_West = plane_West
+        self.plane_shell = plane_shell # per plane, shell number in order of inclination
+        self.plane_inclination = plane_inclination # per plane, mean inclination in degrees
+        self.plane_raan = plane_raan # per plane, circular mean RAAN in degrees at the reference time
+        self.reference_time = reference_time
+
+    def get_num_planes(self):
+        return len(self.plane_sizes)
+
+    def get_num_assigned(self):
+        return int((self.orbit_number >= 0).sum())
+
+    def print_summary(self):
+        print(f'Discovered {self.get_num_planes()} planes holding {self.get_num_assigned()} of {len(self.satnums)} satellites')
+        if self.get_num_planes() > 0:
+            print(f'\tSatellites per plane: min {self.plane_sizes.min()}, median {int(np.median(self.plane_sizes))}, max {self.plane_sizes.max()}')
+            for shell in np.unique(self.plane_shell).tolist():
+                in_shell = self.plane_shell == shell
+                print(f'\tShell {shell}: {in_shell.sum()} planes at {self.plane_inclination[in_shell].mean():.2f} deg, {self.plane_sizes[in_shell].sum()} satellites')
+
+def get_gap_clusters(sorted_values, tolerance, period=None): # cluster label per sorted value, a new cluster after each gap > tolerance
+    labels = np.concatenate(([0], np.cumsum(np.diff(sorted_values) > tolerance)))
+    if (period is not None) and (labels[-1] > 0) and (sorted_values[0] + period - sorted_values[-1] <= tolerance):
+        labels[labels == labels[-1]] = 0 # the last cluster wraps around into the first
+    return labels
+
+def get_circular_mean_degrees(angles):
+    radians = np.radians(angles)
+    return np.degrees(np.arctan2(np.sin(radians).mean(), np.cos(radians).mean())) % 360.0
+
+def discover_planes(satnums, inclination, raan, mean_motion, arg_lat, inc_tolerance=plane_inc_tolerance, raan_tolerance=plane_raan_tolerance,
+                    mean_motion_tolerance=plane_mean_motion_tolerance, min_plane_size=min_sats_per_plane):
+    # inclination, RAAN and argument of latitude in degrees and mean motion in revs/day, all at one reference time
+    num_rows = len(satnums)
+    raan = np.mod(raan, 360.0)
+    orbit_number = np.full(num_rows, -1, dtype=np.int64)
+    sat_index = np.full(num_rows, -1, dtype=np.int64)
+    plane_sizes, plane_East, plane_West, plane_shell, plane_inclination, plane_raan = [], [], [], [], [], []
+    if num_rows == 0:
+        shells = []
+    else:
+        inc_order = np.argsort(inclination, kind='stable')
+        shell_of = np.empty(num_rows, dtype=np.int64)
+        shell_of[inc_order] = get_gap_clusters(inclination[inc_order], inc_tolerance)
+        shell_order = np.lexsort((raan, shell_of)) # by shell, then by RAAN within the shell
+        shells = np.split(shell_order, np.flatnonzero(np.diff(shell_of[shell_order])) + 1)
+
+    for shell, shell_rows in enumerate(shells):
+        labels = get_gap_clusters(raan[shell_rows], raan_tolerance, 360.0)
+        label_order = np.argsort(labels, kind='stable')
+        shell_planes = []
+        for rows in np.split(shell_rows[label_order], np.flatnonzero(np.diff(labels[label_order])) + 1):
+            rows = rows[np.abs(mean_motion[rows] - np.median(mean_motion[rows])) <= mean_motion_tolerance]
+            if len(rows) < min_plane_size:
+                continue
+            shell_planes.append((get_circular_mean_degrees(raan[rows]), rows))
+        if len(shell_planes) == 0:
+            continue
+        shell_planes.sort(key=lambda plane: plane[0])
+        plane_raans = np.array([plane[0] for plane in shell_planes])
+        gaps = np.diff(np.append(plane_raans, plane_raans[0] + 360.0)) # gaps[k] is from plane k East to the next one
+        widest = int(np.argmax(gaps))
+        wrap = (len(shell_planes) >= 3) and (gaps[widest] <= 2 * np.median(gaps))
+        if not wrap: # partial shell: start just East of its widest gap so the planes run West to East without a seam
+            shell_planes = shell_planes[widest + 1:] + shell_planes[:widest + 1]
+        first_orbit = len(plane_sizes)
+        num_shell_planes = len(shell_planes)
+        for k, (plane_raan_degrees, rows) in enumerate(shell_planes):
+            rows = rows[np.argsort(arg_lat[rows], kind='stable')]
+            orbit_number[rows] = first_orbit + k
+            sat_index[rows] = np.arange(len(rows))
+            plane_sizes.append(len(rows))
+            if wrap:
+                plane_East.append(first_orbit + (k + 1) % num_shell_planes)
+                plane_West.append(first_orbit + (k - 1) % num_shell_planes)
+            else:
+                plane_East.append(first_orbit + k + 1 if k + 1 < num_shell_planes else -1)
+                plane_West.append(first_orbit + k - 1 if k > 0 else -1)
+            plane_shell.append(shell)
+            plane_inclination.append(float(inclination[rows].mean()))
+            plane_raan.append(plane_raan_degrees)
+
+    return plane_assignment(np.asarray(satnums), orbit_number, sat_index, np.array(plane_sizes, dtype=np.int64), np.array(plane_East, dtype=np.int64),
+                            np.array(plane_West, dtype=np.int64), np.array(plane_shell, dtype=np.int64), np.array(plane_inclination), np.array(plane_raan))
+
+def get_catalog_elements(satrecs, reference_time): # (inclination, RAAN, mean motion revs/day, argument of latitude, valid) per satellite
+    whole, fraction, _ = get_sgp4_time_split(reference_time)
+    columns = np.array([(satrec.jdsatepoch, satrec.jdsatepochF, satrec.inclo, satrec.nodeo, satrec.nodedot, satrec.no_kozai) for satrec in satrecs], dtype=np.float64).reshape(-1, 6)
+    minutes = ((whole[0] - columns[:, 0]) + (fraction[0] - columns[:, 1])) * 1440.0
+    inclination = np.degrees(columns[:, 2])
+    raan = np.degrees(columns[:, 3] + columns[:, 4] * minutes) % 360.0 # secular J2 regression to the reference time
+    mean_motion = columns[:, 5] * 1440.0 / (2 * pi)
+    state = constellation_propagator(satrecs).propagate(reference_time)
+    valid = (state.errors == 0) & ~np.isnan(state.teme_r[:, 0]) # SGP4 failures (decayed satellites) stay out of the grid
+    with np.errstate(invalid='ignore'):
+        arg_lat = get_argument_of_latitude_degrees(state.teme_r, state.teme_v)
+    return inclination, raan, mean_motion, arg_lat, valid
+
+def build_catalog_constellation(tle_path=None, reference_time=None, name_pattern=catalog_name_pattern, verbose=True):
+    # replaces the current constellation with the planes discovered in a real TLE catalog; returns the plane_assignment
+    global time_scale, num_sats
+    start = time.time()
+    if tle_path is None:
+        tle_path = catalog_tle_path
+    if time_scale == 0:
+        time_scale = load.timescale()
+    tle_errors = []
+    satellites = tle_reader.load_satellites(tle_path, time_scale, name_pattern, errors=tle_errors)
+    if verbose:
+        print(f'Loaded {len(satellites)} satellites from {tle_path} ({len(tle_errors)} malformed entries skipped)')
+    if len(satellites) == 0:
+        raise ValueError(f'No satellites in {tle_path} match {name_pattern!r}')
+    _, first_rows = np.unique([sat.model.satnum for sat in satellites], return_index=True) # a repeated catalog number keeps its first entry
+    satellites = [satellites[row] for row in np.sort(first_rows)]
+    satrecs = [sat.model for sat in satellites]
+    if reference_time is None: # the median TLE epoch keeps the RAAN extrapolation short for most of the catalog
+        epochs = np.array([satrec.jdsatepoch + satrec.jdsatepochF for satrec in satrecs])
+        reference_time = satellites[int(np.argsort(epochs)[len(epochs) // 2])].epoch
+
+    inclination, raan, mean_motion, arg_lat, valid = get_catalog_elements(satrecs, reference_time)
+    valid_rows = np.flatnonzero(valid)
+    satellites = [satellites[row] for row in valid_rows]
+    satnums = np.array([sat.model.satnum for sat in satellites], dtype=np.int64)
+    planes = discover_planes(satnums, inclination[valid_rows], raan[valid_rows], mean_motion[valid_rows], arg_lat[valid_rows])
+    planes.reference_time = reference_time
+
+    reset_constellation()
+    grid_rows = np.lexsort((planes.sat_index, planes.orbit_number))
+    grid_rows = grid_rows[planes.orbit_number[grid_rows] >= 0]
+    plane_sizes = planes.plane_sizes.tolist()
+    plane_East = planes.plane_East.tolist()
+    plane_West = planes.plane_West.tolist()
+    for row, orbit_number, sat_index in zip(grid_rows.tolist(), planes.orbit_number[grid_rows].tolist(), planes.sat_index[grid_rows].tolist()):
+        plane_size = plane_sizes[orbit_number]
+        if sat_index == 0:
+            orbit_list.append([])
+        orbit_list[orbit_number].append(satellites[row])
+        sat_registry.add(routing_sat(satellites[row], int(satnums[row]), orbit_number, sat_index, plane_East[orbit_number], plane_West[orbit_number],
+                                     (sat_index + 1) % plane_size, (sat_index - 1) % plane_size))
+    num_sats = len(sat_registry)
+    if verbose:
+        planes.print_summary()
+        print(f'Built the catalog routing grid in {time.time() - start:.2f} seconds')
+    return planes
+
+def is_constellation_file_current(path): # exists, and is not older than the catalog it would have been built from
+    if (path is None) or not os.path.exists(path):
+        return False
+    return (catalog_tle_path is None) or (os.path.getmtime(path) >= os.path.getmtime(catalog_tle_path))
+
+def main ():
+    if is_constellation_file_current(constellation_path):
+        load_constellation(constellation_path)
+    else:
+        if catalog_tle_path is not None:
+            build_catalog_constellation(catalog_tle_path)
+        else:
+            source_sat = build_constellation()
+        if constellation_path is not None:
+            save_constellation(constellation_path)
 
     """
     print(f'\n~~~~~~~~~~ Comparing fake_sat 0 against source satellite ~~~~~~~~~~')
@@ -1012,9 +3246,10 @@ def main ():
     stdout.writelines(dump_satrec(orbit_list[0][0].model, source_sat.model))
     print('\n')
     """
-    global cur_time
-    cur_time = time_scale.utc(2023, 5, 9, 0, 0)
+    set_cur_time(time_scale.utc(2023, 5, 9, 0, 0))
     print(f"Set current time to: {cur_time.utc_jpl()}")
+
+    get_propagator()
        
 
     # ---------- TESTING ------------
@@ -1028,6 +3263,9 @@ def main ():
     #test_North_South_path()
     #exit ()
 
+    if draw_dynamic_orbits:
+        draw_dynamic_orig()
+
     # ---------- ROUTING ------------   
 
     blacksburg = wgs84.latlon(+37.2296, -80.4139) #37.2296deg N, 80.4139deg W
@@ -1044,6 +3282,15 @@ def main ():
 
     find_route_dijkstra(src, dest)
 
+    route = find_route_dijkstra_heap(src, dest)
+    if route is not None:
+        draw_static_plot(route.satnum_list, title=f'Dijkstra (heap): {route.get_hop_count()} hops, {route.distance_km:.2f}km distance')
+
+    if simulate:
+        run_simulation(src, dest, cur_time, cur_time + simulation_seconds / DAY_S, time_interval)
+
+    for path in finish_rendering():
+        print(f'Wrote {path}')
     exit()
 
 if __name__ == "__main__":
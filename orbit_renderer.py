@@ -0,0 +1,122 @@
+# Rendering layer for orbit_generator.py
+# matplotlib is only imported once something is actually drawn. In headless mode figures are built with the
+# object-oriented Figure API and written to PNG through the Agg canvas on a background thread, so batch routing
+# never blocks on plt.show() and worker processes never pay the matplotlib import
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+
+# Options
+headless = False
+plot_colors = ['red', 'purple', 'blue', 'orange', 'green', 'yellow', 'olive', 'cyan', 'brown']
+axis_limit_km = 6000 # hardcode the xyz limits to keep all satellite plots on same scale
+animation_marker_size = 2
+render_executor = None # single background thread that writes headless PNGs, created on first use
+pending_renders = []
+
+def set_headless(enable):
+    global headless
+    headless = enable
+    if headless:
+        import matplotlib
+        matplotlib.use('Agg') # no display needed; must happen before pyplot is imported anywhere
+
+def get_pyplot(): # interactive pyplot, imported on first use
+    import matplotlib
+    if headless:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import axes3d # registers the '3d' projection on older matplotlib
+    return plt
+
+def set_orbit_axes(ax, title=None):
+    if title is not None:
+        ax.set_title(title)
+    ax.set_xlim3d(-axis_limit_km, axis_limit_km)
+    ax.set_ylim3d(-axis_limit_km, axis_limit_km)
+    ax.set_zlim3d(-axis_limit_km, axis_limit_km)
+
+def draw_route_axes(ax, x_array, y_array, z_array, title):
+    set_orbit_axes(ax, title)
+    color_array = [plot_colors[i % len(plot_colors)] for i in range(len(x_array))]
+    ax.scatter(x_array, y_array, z_array, c=color_array)
+    ax.plot(x_array, y_array, z_array, color = 'black')
+
+def render_route_png(x_array, y_array, z_array, title, out_path): # Agg only, safe to run off the main thread
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from mpl_toolkits.mplot3d import axes3d
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    draw_route_axes(fig.add_subplot(111, projection='3d'), x_array, y_array, z_array, title)
+    fig.savefig(out_path)
+    return out_path
+
+def show_route(x_array, y_array, z_array, title): # blocks until the window is closed
+    plt = get_pyplot()
+    fig = plt.figure()
+    draw_route_axes(fig.add_subplot(111, projection='3d'), x_array, y_array, z_array, title)
+    plt.show()
+
+def submit_render(function, *args): # runs function(*args) on the background render thread; returns its Future
+    global render_executor
+    if render_executor is None:
+        render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='orbit_renderer')
+    future = render_executor.submit(function, *args)
+    pending_renders.append(future)
+    return future
+
+def submit_route_png(x_array, y_array, z_array, title, out_path):
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    return submit_render(render_route_png, x_array, y_array, z_array, title, out_path)
+
+def wait_for_renders(): # blocks until every submitted render is written; returns the paths, re-raising render errors
+    paths = [future.result() for future in pending_renders]
+    del pending_renders[:]
+    return paths
+
+def get_plot_path(plot_dir, title, index): # numbered, filesystem-safe file name derived from the plot title
+    slug = ''.join(c if c.isalnum() else '_' for c in title).strip('_')
+    return os.path.join(plot_dir, f'{index:04d}_{slug[:60]}.png')
+
+def build_orbit_animation(fig, frames, orbit_numbers, title=None, fps=20):
+    # frames: (T, N, 3) positions, orbit_numbers: (N,) plane of each column. One marker-only line per plot colour
+    # (planes sharing a colour share an artist), updated in place and blitted, so frame cost is independent of plane count
+    from matplotlib.animation import FuncAnimation
+    from mpl_toolkits.mplot3d import axes3d
+    ax = fig.add_subplot(111, projection='3d')
+    set_orbit_axes(ax, title)
+    groups = []
+    for color_index, color in enumerate(plot_colors):
+        columns = np.flatnonzero(np.asarray(orbit_numbers) % len(plot_colors) == color_index)
+        if len(columns) == 0:
+            continue
+        line, = ax.plot([], [], [], linestyle='', marker='o', markersize=animation_marker_size, color=color, animated=True)
+        groups.append((line, np.ascontiguousarray(np.moveaxis(frames[:, columns], 2, 0)))) # (3, T, n) so a frame is three slices
+    artists = [line for line, _ in groups]
+
+    def update(frame_index):
+        for line, group_frames in groups:
+            line.set_data_3d(group_frames[0, frame_index], group_frames[1, frame_index], group_frames[2, frame_index])
+        return artists
+
+    return FuncAnimation(fig, update, frames=len(frames), interval=1000 / fps, blit=True)
+
+def save_orbit_animation(frames, orbit_numbers, out_path, title=None, fps=20): # offline MP4 (ffmpeg) or GIF (Pillow), no display
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    animation = build_orbit_animation(fig, frames, orbit_numbers, title, fps)
+    writer = 'pillow' if out_path.lower().endswith('.gif') else 'ffmpeg'
+    animation.save(out_path, writer=writer, fps=fps)
+    return out_path
+
+def show_orbit_animation(frames, orbit_numbers, title=None, fps=20): # blocks until the window is closed
+    plt = get_pyplot()
+    fig = plt.figure()
+    animation = build_orbit_animation(fig, frames, orbit_numbers, title, fps)
+    plt.show()
+    return animation
@@ -3,12 +3,15 @@ from numpy import array2string
 from numpy.linalg import norm
 from math import sqrt
 import csv
-import pandas as pd
 
 import time
 
 import random
 
+import numpy as np
+
+import tle_reader
+
 #import matplotlib.pyplot as plt
 #import numpy
 #import scipy.cluster.hierarchy as shc
@@ -68,6 +71,42 @@ def get_satellite_height(sat, t):
     #subpoint = wgs84.latlon(lat.degrees, lon.degrees, 0)
     #print (f'Satellite 0 has altitude of {height.km}km')
 
+# :: Orbital slotting ::
+# Same greedy grouping as the original data_frame loop: the first remaining satellite seeds a plane and every remaining
+# satellite within the inclination / RAAN / eccentricity tolerances of the seed joins it. The elements are pulled into
+# numpy columns once; satellites are sorted by RAAN, so each seed only sweeps its own RAAN window (wrapped at 360 deg)
+def get_tle_columns(tle_table): # (names, inclination deg, RAAN deg, eccentricity x 1e7) from a tle_reader table
+    ecc = np.round(tle_table['ecc'] * 1e7) # TLE eccentricity digits, the scale Ecc_tolerance is given in
+    return tle_table['name'], tle_table['inclination'], tle_table['raan'], ecc
+
+def slot_orbits(names, inclination, raan, ecc, Inc_tolerance, RaaN_tolerance, Ecc_tolerance, name_filter='STARLINK', satnums=None):
+    # returns orbit_list: [[name, inclination, RaaN, eccentricity] per satellite] per plane, seed first, then catalog order.
+    # When satnums is given each entry also carries the NORAD ID as a fifth field
+    keep = np.array([name_filter in name for name in names]) if name_filter is not None else np.ones(len(names), dtype=bool)
+    rows = np.flatnonzero(keep)
+    raan = np.mod(raan, 360.0)
+    order = rows[np.argsort(raan[rows], kind='stable')]
+    # sorted RAANs repeated one turn below and above, so a window that crosses 0/360 is still one contiguous slice
+    sweep_raan = np.concatenate((raan[order] - 360.0, raan[order], raan[order] + 360.0))
+    sweep_rows = np.concatenate((order, order, order))
+    remaining = keep.copy()
+    orbit_list = []
+    for seed in rows: # seeds in catalog order, skipping satellites an earlier plane already took
+        if not remaining[seed]:
+            continue
+        start = np.searchsorted(sweep_raan, raan[seed] - RaaN_tolerance, side='right')
+        end = np.searchsorted(sweep_raan, raan[seed] + RaaN_tolerance, side='left')
+        candidates = np.unique(sweep_rows[start:end]) # catalog order; unique also guards tolerances of 180 deg or more
+        candidates = candidates[remaining[candidates] & (candidates != seed)]
+        match = (np.abs(inclination[candidates] - inclination[seed]) < Inc_tolerance) & (np.abs(ecc[candidates] - ecc[seed]) < Ecc_tolerance)
+        members = np.concatenate(([seed], candidates[match]))
+        remaining[members] = False
+        if satnums is None:
+            orbit_list.append([[names[i], float(inclination[i]), float(raan[i]), float(ecc[i])] for i in members])
+        else:
+            orbit_list.append([[names[i], float(inclination[i]), float(raan[i]), float(ecc[i]), int(satnums[i])] for i in members])
+    return orbit_list
+
 def main():
     ts = load.timescale()
     #line1 = '1 25544U 98067A   14020.93268519  .00009878  00000-0  18200-3 0  5082'
@@ -86,10 +125,13 @@ def main():
     #    i += 1
     #    if i == 3:
     #        break
-    col_headers = [0, 1, 2, 3, 4, 5, 6, 7, 8]
-    data_frame = pd.read_csv(tle_path, header=None, delim_whitespace=True, names=col_headers, engine='python')
-    #print(data_frame)
-    #print(data_frame.dtypes)
+    element_table_path = None # e.g. 'tle_elements.csv' to export every element column (replaces AoPs.csv / inclinations.csv)
+    tle_errors = []
+    tle_table = tle_reader.read_tle_table(tle_path, name_pattern='STARLINK', errors=tle_errors)
+    for line_number, reason in tle_errors:
+        print(f'Skipped malformed TLE at line {line_number}: {reason}')
+    if element_table_path is not None:
+        tle_reader.save_tle_table(tle_table, element_table_path)
 
     """
     tolerance = 2
@@ -151,39 +193,6 @@ def main():
     Ecc_tolerance = 5000
     RaaN_tolerance = 30
     
-    """
-    AoP_list = []
-    for i in range(0, len(data_frame), 3):
-        AoP_list.append(float(data_frame.iloc[i+2,5]))
-    with open ('AoPs.csv', 'w') as f:
-        writer = csv.writer(f)
-        writer.writerow(AoP_list)
-    print(AoP_list[:10])
-    exit ()
-    """
-
-    """
-    inclination_list = []
-    for i in range(0, len(data_frame), 3):
-        inclination_list.append(float(data_frame.iloc[i+2,2]))
-
-    with open ('inclinations.csv', 'w') as f:
-        writer = csv.writer(f)
-        writer.writerow(inclination_list)
-
-    print(inclination_list[:10])
-
-    exit ()
-
-    twoD_inclination_list = np.reshape(inclination_list, (-1, 1))
-    km = KMeans()
-    #km.fit(twoD_inclination_list)
-    labels = km.fit_predict(twoD_inclination_list)
-    print (labels)
-
-    exit ()
-
-    """
     #plot
     #plt.plot(km)
     #plt.axis('equal')
@@ -208,64 +217,10 @@ def main():
     #plt.title(title)
     #plt.show()
 
-    orbit_list = []
-    #orbit_list.append(initial_orbit)
-    done = False
-    print(f'Number of satellites in data_frame: {int(len(data_frame)/3)}')
-    while (not done):
-        remove_list = [0,1,2]
-        orbit = []
-        initial_sat = [data_frame.iat[0,0], float(data_frame.iat[2,2]), data_frame.iat[2,3], data_frame.iat[2,4]] # Sat_name, inclination, RaaN, eccentricity
-        orbit.append(initial_sat)
-        for i in range(3, len(data_frame), 3):  #start at next satellite entry and count by 3's
-            name = data_frame.iloc[i,0]
-            if not 'STARLINK' in name:
-                remove_list.append(i)
-                remove_list.append(i+1)
-                remove_list.append(i+2)
-                continue
-            try:
-                Inclination = float(data_frame.iloc[i+2,2])
-            except:
-                print(f'Bad inclination read on data_frame index {i}.\nData_frame row {i}: {data_frame.iloc[i]}\nData_frame row {i+2}: {data_frame.iloc[i+2]}\nInclination: {data_frame.iloc[i+2,2]}\nNumber of satellites remaining in data_frame: {len(data_frame)/3}.\nInitial_sat: {initial_sat}')
-                exit()
-            if ((initial_sat[1] - Inc_tolerance < Inclination) and (initial_sat[1] + Inc_tolerance > Inclination)):
-                RaaN = data_frame.iloc[i+2,3]
-                if ((initial_sat[2] - RaaN_tolerance < RaaN) and (initial_sat[2] + RaaN_tolerance > RaaN)):
-                    Ecc = data_frame.iloc[i+2,4]
-                    if ((initial_sat[3] - Ecc_tolerance < Ecc) and (initial_sat[3] + Ecc_tolerance > Ecc)):
-                        sat = [name, Inclination, RaaN, Ecc]
-                        orbit.append(sat)
-                        remove_list.append(i)
-                        remove_list.append(i+1)
-                        remove_list.append(i+2)
-                        continue
-        orbit_list.append(orbit)
-
-        #print(f'Removing {len(remove_list)} entries from data frame')
-        #print(f'Size of data_frame: {len(data_frame)}')
-        #print(data_frame)
-        #remove_list.sort(reverse=True)
-        data_frame.drop(remove_list, inplace = True)
-        data_frame.reset_index(drop=True, inplace=True)
-        #for i in remove_list:
-            #data_frame.drop(data_frame.index[i:i+2], inplace=True)
-            #data_frame = data_frame.drop(data_frame.index[i:i+2])
-        #print(f'Remaining number of satellites in data_frame: {int(len(data_frame)/3)}')
-        if (len(data_frame)%3 != 0):
-            print('Irregular number of remaining rows!  Exitting')
-            exit()
-        if len(data_frame) < 6:
-            print('Done parsing data_frame!')
-            done = True
-            if len(data_frame) == 3:
-                orbit = []
-                initial_sat = [data_frame.iat[0,0], float(data_frame.iat[2,2]), data_frame.iat[2,3], data_frame.iat[2,4]]
-                orbit.append(initial_sat)
-                orbit_list.append(orbit)
-
-
-
+    print(f'Number of Starlink satellites in TLE table: {len(tle_table)}')
+    slotting_start = time.time()
+    orbit_list = slot_orbits(*get_tle_columns(tle_table), Inc_tolerance, RaaN_tolerance, Ecc_tolerance, name_filter=None, satnums=tle_table['satnum'])
+    print(f'Slotted {sum(len(o) for o in orbit_list)} satellites in {time.time() - slotting_start:.3f} seconds')
 
     print(f"\nOrbital slotting using following tolerances:"
           f"\n\tInclination +/- {Inc_tolerance}"
@@ -376,23 +331,17 @@ def main():
     AoP_list.sort()
     print(f"Unique Arguments of Perigee of recorded orbits:\n{AoP_list}")
     """
-    satellites = load.tle_file(tle_path)
-    print('Loaded', len(satellites), 'satellites')
-
-    remove_ctr = 0
-    for s in satellites:
-        if 'STARLINK' not in s.name:
-            satellites.remove(s)
-            remove_ctr += 1
-    print(f'Removed {remove_ctr} non-Starlink satellites; size of satellites: {len(satellites)}')
+    satellites = tle_reader.load_satellites(tle_path, ts, name_pattern='STARLINK', satnums=set(tle_table['satnum'].tolist())) # only the slotted entries become EarthSatellites
+    print('Loaded', len(satellites), 'Starlink satellites')
     
+    satellites_by_satnum = {} # matched on NORAD ID; table names are cut to the dtype width and need not be unique
+    for s in satellites:
+        satellites_by_satnum.setdefault(s.model.satnum, []).append(s)
     loaded_orbit_list = []
     for o in orbit_list:
         loaded_orbit = []
         for i in o:
-            for s in satellites:
-                if s.name == i[0]:
-                    loaded_orbit.append(s)
+            loaded_orbit += satellites_by_satnum.get(i[4], [])
         loaded_orbit_list.append(loaded_orbit)
     print(f'\nNumber of seperate loaded orbits: {len(loaded_orbit_list)}')
     print(f'Number of satellites in first loaded orbit: {len(loaded_orbit_list[0])}')
@@ -1,14 +1,28 @@
 from skyfield.api import EarthSatellite, load, wgs84
+from sgp4.api import SatrecArray
 from numpy import array2string
 from numpy.linalg import norm
 from math import sqrt
 import csv
+import json
+import hashlib
+import os
+import sys
 import pandas as pd
 
 import time
 
 import random
 
+import numpy as np
+
+import tle_reader
+# shared SGP4 time split and WGS84 geodetic conversion
+from orbit_generator import get_sgp4_time_split, itrs_to_geodetic
+
+# Distance orbit clustering
+clustering_chunk_bytes = 64 * 1024 * 1024 # upper bound on the (T, chunk, 3) separation block built per seed
+clustering_checkpoint_path = None # JSON Lines file the clustering appends each finished orbit to, and resumes from
 
 
 # My own
@@ -45,65 +59,141 @@ def get_satellite_height(sat, t):
     #subpoint = wgs84.latlon(lat.degrees, lon.degrees, 0)
     #print (f'Satellite 0 has altitude of {height.km}km')
 
+# :: Vectorized distance orbits ::
+# The catalog is propagated once with SatrecArray into a (T, N, 3) TEME array. Each seed's min/max separation to
+# every remaining satellite is then one broadcast reduction over memory-bounded chunks. Separations don't depend on
+# the frame, and geodetic height only depends on distance from the polar axis, so TEME needs no rotation
+def propagate_catalog(satellites, t_span): # (T, N, 3) TEME km, NaN where SGP4 failed; same time split as skyfield
+    satrec_array = SatrecArray([s.model for s in satellites])
+    whole, fraction, _ = get_sgp4_time_split(t_span)
+    _, r, _ = satrec_array.sgp4(whole, fraction) # (N, T, 3)
+    return np.ascontiguousarray(r.transpose(1, 0, 2))
+
+def get_separation_spread(positions, seed, candidates, chunk_size): # max - min seed separation (km) per candidate over t_span
+    spread = np.empty(len(candidates))
+    seed_positions = positions[:, seed, np.newaxis, :] # (T, 1, 3)
+    for first in range(0, len(candidates), chunk_size):
+        diff = positions[:, candidates[first:first + chunk_size], :] - seed_positions # (T, chunk, 3)
+        distance = np.sqrt(np.einsum('tcx,tcx->tc', diff, diff))
+        spread[first:first + chunk_size] = distance.max(axis=0) - distance.min(axis=0)
+    return spread
+
+def iter_distance_orbits(satellites, t_span, remaining=None, chunk_bytes=clustering_chunk_bytes):
+    # same grouping as the original per-pair loop: the first remaining satellite seeds an orbit, and every remaining
+    # satellite whose separation from it varies by less than 3x the seed's (truncated) height variation joins it.
+    # Yields (orbit rows, rows still remaining) as each orbit completes; remaining restricts the run to those rows
+    positions = propagate_catalog(satellites, t_span)
+    heights = itrs_to_geodetic(positions)[2] # WGS84 height, km
+    height_diff = np.trunc(heights.max(axis=0) - heights.min(axis=0))
+    chunk_size = max(1, chunk_bytes // (positions.shape[0] * 3 * positions.itemsize))
+    remaining = np.arange(len(satellites)) if remaining is None else np.asarray(remaining, dtype=np.int64)
+    while len(remaining) > 0:
+        seed = remaining[0]
+        candidates = remaining[1:]
+        spread = get_separation_spread(positions, seed, candidates, chunk_size)
+        joined = spread < (height_diff[seed] * 3)
+        remaining = candidates[~joined]
+        yield np.concatenate(([seed], candidates[joined])), remaining
+
+def compute_distance_orbits(satellites, t_span, chunk_bytes=clustering_chunk_bytes):
+    return [[satellites[row] for row in rows] for rows, _ in iter_distance_orbits(satellites, t_span, chunk_bytes=chunk_bytes)]
+
+# :: Checkpointed clustering ::
+# One JSON object per line: a header identifying the catalog and time span, then one record per finished orbit,
+# flushed and fsynced as it completes. A rerun with the same checkpoint skips the recorded orbits and carries on
+def get_catalog_fingerprint(satellites, t_span): # changes if the catalog, its order, or the time span changes
+    digest = hashlib.sha256()
+    for s in satellites:
+        digest.update(f'{s.name}|{s.model.satnum}|{s.model.jdsatepoch!r}|{s.model.jdsatepochF!r}\n'.encode())
+    digest.update(repr(np.atleast_1d(t_span.tt).tolist()).encode())
+    return digest.hexdigest()
+
+def read_clustering_checkpoint(checkpoint_path, fingerprint): # (orbit rows already done, byte offset of the last good line)
+    orbit_rows = []
+    good_offset = 0
+    with open(checkpoint_path, 'rb') as checkpoint_file:
+        for line in checkpoint_file:
+            try:
+                record = json.loads(line)
+            except ValueError: # torn write from an interrupted run; everything after it is discarded
+                break
+            if not line.endswith(b'\n'):
+                break
+            if record['type'] == 'header':
+                if record['fingerprint'] != fingerprint:
+                    raise ValueError(f'{checkpoint_path} was written for a different catalog or time span')
+            elif record['type'] == 'orbit':
+                orbit_rows.append(record['rows'])
+            good_offset += len(line)
+    return orbit_rows, good_offset
+
+def print_progress(event): # default progress sink: one JSON object per line on stdout, for the batch scheduler
+    print(json.dumps(event), flush=True)
+
+def run_distance_orbit_clustering(satellites, t_span, checkpoint_path=None, progress=print_progress, chunk_bytes=clustering_chunk_bytes):
+    # compute_distance_orbits with a JSON Lines checkpoint and structured progress events; returns distance_orbit_list
+    if checkpoint_path is None:
+        checkpoint_path = clustering_checkpoint_path
+    start_time = time.time()
+    orbit_rows = []
+    checkpoint_file = None
+    if checkpoint_path is not None:
+        fingerprint = get_catalog_fingerprint(satellites, t_span)
+        good_offset = 0
+        if os.path.exists(checkpoint_path):
+            orbit_rows, good_offset = read_clustering_checkpoint(checkpoint_path, fingerprint)
+        checkpoint_file = open(checkpoint_path, 'r+b' if good_offset > 0 else 'wb')
+        checkpoint_file.seek(good_offset)
+        checkpoint_file.truncate()
+        if good_offset == 0:
+            header = {'type': 'header', 'fingerprint': fingerprint, 'num_sats': len(satellites), 'num_times': int(np.size(t_span.tt))}
+            checkpoint_file.write((json.dumps(header) + '\n').encode())
+            checkpoint_file.flush()
+    done_rows = set(row for rows in orbit_rows for row in rows)
+    remaining = np.array([row for row in range(len(satellites)) if row not in done_rows], dtype=np.int64)
+    resumed_orbits = len(orbit_rows)
+    resumed_sats = len(done_rows)
+    progress({'event': 'start', 'orbits_done': resumed_orbits, 'sats_done': resumed_sats, 'sats_remaining': len(remaining), 'resumed': resumed_orbits > 0})
+    try:
+        for rows, remaining in iter_distance_orbits(satellites, t_span, remaining, chunk_bytes):
+            orbit_rows.append(rows.tolist())
+            if checkpoint_file is not None:
+                record = {'type': 'orbit', 'index': len(orbit_rows) - 1, 'rows': orbit_rows[-1], 'names': [satellites[row].name for row in orbit_rows[-1]]}
+                checkpoint_file.write((json.dumps(record) + '\n').encode())
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+            elapsed = time.time() - start_time
+            sats_done = len(satellites) - len(remaining)
+            progress({'event': 'orbit', 'orbit': len(orbit_rows) - 1, 'orbit_size': len(rows), 'orbits_done': len(orbit_rows), 'sats_done': sats_done,
+                      'sats_remaining': len(remaining), 'elapsed_s': round(elapsed, 3), 'sats_per_s': round((sats_done - resumed_sats) / elapsed, 1) if elapsed > 0 else None})
+    except KeyboardInterrupt:
+        progress({'event': 'interrupted', 'orbits_done': len(orbit_rows), 'sats_remaining': len(remaining), 'checkpoint': checkpoint_path})
+        raise
+    finally:
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+    progress({'event': 'done', 'orbits_done': len(orbit_rows), 'sats_done': len(satellites), 'elapsed_s': round(time.time() - start_time, 3)})
+    return [[satellites[row] for row in rows] for rows in orbit_rows]
+
 def main():
     ts = load.timescale()
     tle_path = '/home/alexk1/Documents/satellite_data/starlink_9MAY23.txt'
     #starlink_url = 'https://celestrak.org/NORAD/elements/gp.php?GROUP=starlink&FORMAT=tle'   
 
-    satellites = load.tle_file(tle_path)
-    print('Loaded', len(satellites), 'satellites')
-
-    remove_ctr = 0
-    for s in satellites:
-        if 'STARLINK' not in s.name:
-            satellites.remove(s)
-            remove_ctr += 1
-    print(f'Removed {remove_ctr} non-Starlink satellites; size of satellites: {len(satellites)}')
+    satellites = tle_reader.load_satellites(tle_path, ts, name_pattern='STARLINK') # filtered while streaming, before any EarthSatellite is built
+    print('Loaded', len(satellites), 'Starlink satellites')
     
 
     # Computing Distance Orbits
     start_time = time.time()
-    distance_orbit_list = []
     t_range = range(0,10)
     t_span = ts.utc(2023, 5, 9, t_range) # calculate max/min distance over two hour interval
     print(f'\nComputing distance orbits over a {len(t_range)} hour range\n')
-    ctr = 0
-    while True:
-        print(f'Number of satellites considered for orbit {ctr}: {len(satellites)}')
-        if len(satellites) < 1:
-            break
-        if len(satellites) == 1:
-            distance_orbit.append(satellites[0])
-            distance_orbit_list.append(distance_orbit)
-            break
-        distance_orbit = []
-        remove_list = [0]
-        distance_orbit.append(satellites[0])
-        min_height = min(get_satellite_height(satellites[0], t_i) for t_i in t_span)
-        max_height = max(get_satellite_height(satellites[0], t_i) for t_i in t_span)
-        height_diff = int(max_height - min_height)
-        for i in range(1, len(satellites)):
-            dist_min = min(((satellites[0].at(t_i) - satellites[i].at(t_i)).distance().km) for t_i in t_span)
-            dist_max = max(((satellites[0].at(t_i) - satellites[i].at(t_i)).distance().km) for t_i in t_span)
-            dist_diff = dist_max-dist_min
-            if (dist_diff < (height_diff * 3)):  # the seperation between the two satellites is less than 3x the altitude difference of first satellite, so they stay fixed within a range
-                distance_orbit.append(satellites[i])
-                remove_list.append(i)
-                print(f'\r>> Adding satellite to orbit {ctr}. Orbit has {len(remove_list)} satellites', end='')
-        #print(f'\nOrbit {ctr} has {len(remove_list)} satellites')
-        distance_orbit_list.append(distance_orbit)
-        remove_list.sort(reverse=True)
-        for i in remove_list:
-            satellites.pop(i)
-        #ctr += 1
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        print(f"\nOrbit {ctr} has {len(remove_list)} satellites (Has been running for {int(elapsed_time/60)} minutes)\n")
-        ctr += 1
+    distance_orbit_list = run_distance_orbit_clustering(satellites, t_span, sys.argv[1] if len(sys.argv) > 1 else None)
     end_time = time.time()
     elapsed_time = end_time - start_time
     print(f'Computed {len(distance_orbit_list)} distance orbits')
-    print(f"Took {int(elapsed_time/60)} minutes to compute")
+    print(f"Took {elapsed_time:.2f} seconds to compute")
 
     print(f"Testing orbital distances of satellite distance calculations")
 
@@ -0,0 +1,87 @@
+import pytest
+from skyfield.api import load
+
+import tle_reader
+
+line1 = '1 25544U 98067A   14020.93268519  .00009878  00000-0  18200-3 0  5082'
+line2 = '2 25544  51.6498 109.4756 0003572  55.9686 274.8005 15.49815350868473'
+
+def get_entry(satnum, name=None): # title line and line pair with the catalog number swapped in
+    entry = [line1.replace('25544', str(satnum)), line2.replace('25544', str(satnum))]
+    return ([name] if name is not None else []) + entry
+
+def write_tle(tmp_path, lines):
+    tle_path = tmp_path / 'catalog.txt'
+    tle_path.write_text('\n'.join(lines) + '\n')
+    return str(tle_path)
+
+def read(tle_path, **kwargs):
+    errors = []
+    table = tle_reader.read_tle_table(tle_path, errors=errors, **kwargs)
+    return table, errors
+
+def test_reads_two_and_three_line_entries(tmp_path):
+    tle_path = write_tle(tmp_path, get_entry(10001, 'SAT A') + get_entry(10002) + get_entry(10003, '0 SAT C'))
+    table, errors = read(tle_path)
+    assert errors == []
+    assert list(table['name']) == ['SAT A', '10002', 'SAT C']
+    assert list(table['satnum']) == [10001, 10002, 10003]
+    assert table['inclination'][0] == pytest.approx(51.6498)
+    assert table['ecc'][0] == pytest.approx(0.0003572)
+    assert table['bstar'][0] == pytest.approx(0.182e-3)
+
+def test_truncated_line1_is_reported_at_its_own_line(tmp_path):
+    entry = get_entry(10002, 'SAT B')
+    entry[1] = entry[1][:40]
+    tle_path = write_tle(tmp_path, get_entry(10001, 'SAT A') + entry + get_entry(10003, 'SAT C'))
+    table, errors = read(tle_path)
+    assert errors == [(5, 'line 1 truncated')]
+    assert list(table['satnum']) == [10001, 10003]
+    assert list(table['name']) == ['SAT A', 'SAT C']
+
+def test_truncated_line2_is_reported_at_its_own_line(tmp_path):
+    entry = get_entry(10001, 'SAT A')
+    entry[2] = entry[2][:50]
+    table, errors = read(write_tle(tmp_path, entry + get_entry(10002, 'SAT B')))
+    assert errors == [(3, 'line 2 truncated')]
+    assert list(table['satnum']) == [10002]
+
+def test_satnum_mismatch_and_orphan_lines(tmp_path):
+    mismatched = get_entry(10001, 'SAT A')
+    mismatched[2] = mismatched[2].replace('10001', '10009')
+    lines = mismatched + [line2.replace('25544', '10005')] + ['SAT D', line1.replace('25544', '10006')] + get_entry(10002, 'SAT B')
+    table, errors = read(write_tle(tmp_path, lines))
+    assert errors == [(2, 'satnum mismatch'), (4, 'line 2 without a line 1'), (6, 'line 1 without a line 2')]
+    assert list(table['name']) == ['SAT B']
+
+def test_checksum_is_only_checked_on_request(tmp_path):
+    entry = get_entry(25544, 'ISS')
+    entry[1] = entry[1][:-1] + '0'
+    tle_path = write_tle(tmp_path, entry)
+    assert len(read(tle_path)[0]) == 1
+    table, errors = read(tle_path, verify_checksum=True)
+    assert len(table) == 0 and errors == [(2, 'checksum mismatch')]
+
+def test_corrupted_field_is_skipped_by_every_reader(tmp_path):
+    entry = get_entry(10002, 'SAT B')
+    entry[2] = entry[2][:8] + ' 5x.0540' + entry[2][16:]
+    tle_path = write_tle(tmp_path, get_entry(10001, 'SAT A') + entry)
+    table, table_errors = read(tle_path)
+    satellite_errors = []
+    satellites = tle_reader.load_satellites(tle_path, load.timescale(), errors=satellite_errors)
+    assert list(table['satnum']) == [sat.model.satnum for sat in satellites] == [10001]
+    assert [number for number, _ in table_errors] == [number for number, _ in satellite_errors] == [5]
+
+def test_filters_and_chunks(tmp_path):
+    lines = []
+    for satnum in range(10001, 10011):
+        lines += get_entry(satnum, f'STARLINK-{satnum}' if satnum % 2 else f'ONEWEB-{satnum}')
+    tle_path = write_tle(tmp_path, lines)
+    chunks = list(tle_reader.iter_tle_tables(tle_path, name_pattern='STARLINK', satnums=range(10001, 10008), chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    assert [satnum for chunk in chunks for satnum in chunk['satnum']] == [10001, 10003, 10005, 10007]
+
+def test_alpha5_satnum():
+    assert tle_reader.get_tle_satnum('A0001') == 100001
+    assert tle_reader.get_tle_satnum('Z9999') == 339999
+    assert tle_reader.get_tle_satnum('25544') == 25544
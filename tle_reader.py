@@ -0,0 +1,152 @@
+# Streaming TLE reader shared by simulator.py and simulator_mk2.py
+# The catalog is read one line at a time and the orbital elements are sliced straight out of the fixed TLE columns,
+# so nothing is split on whitespace and a malformed entry is skipped (and reported) instead of shifting every row after
+# it. Entries are filtered by name / NORAD ID before any field is parsed and collected into fixed-size chunks of a
+# structured numpy table, so memory stays flat no matter how large the catalog is
+import re
+
+import numpy as np
+from sgp4.api import jday
+
+# Options
+tle_chunk_size = 4096 # rows per streamed table chunk
+
+# One row per satellite. Angles in degrees, epoch as a UTC Julian date, mean motion in revolutions per day,
+# bstar in 1 / earth radii
+tle_element_dtype = np.dtype([
+    ('name', 'U24'),
+    ('satnum', np.int32),
+    ('epoch', np.float64),
+    ('inclination', np.float64),
+    ('raan', np.float64),
+    ('ecc', np.float64),
+    ('aop', np.float64),
+    ('mean_anomaly', np.float64),
+    ('mean_motion', np.float64),
+    ('bstar', np.float64),
+])
+
+alpha5_letters = 'ABCDEFGHJKLMNPQRSTUVWXYZ' # Alpha-5 catalog numbers above 99999; I and O are skipped
+
+def get_tle_satnum(field): # five character catalog number field, plain digits or Alpha-5
+    field = field.strip()
+    if field[:1].isalpha():
+        return (alpha5_letters.index(field[0].upper()) + 10) * 10000 + int(field[1:])
+    return int(field)
+
+def get_tle_checksum(line): # modulo 10 sum of the digits, minus signs count as 1
+    return sum(int(c) if c.isdigit() else c == '-' for c in line[:68]) % 10
+
+def get_tle_exponent_field(field): # ' 19613-2' -> 0.19613e-2 (implied leading decimal point)
+    return float(f'{field[0].strip()}.{field[1:6].strip()}e{field[6:8]}')
+
+def get_tle_epoch(line1): # UTC Julian date of the epoch, two digit years 57-99 are 1900s
+    year = int(line1[18:20])
+    year += 1900 if year >= 57 else 2000
+    jd, fraction = jday(year, 1, 1, 0, 0, 0)
+    return jd + fraction + float(line1[20:32]) - 1.0
+
+def parse_tle_elements(name, satnum, line1, line2): # tuple in tle_element_dtype field order
+    return (name, satnum, get_tle_epoch(line1),
+            float(line2[8:16]), float(line2[17:25]), float('0.' + line2[26:33].strip()),
+            float(line2[34:42]), float(line2[43:51]), float(line2[52:63]),
+            get_tle_exponent_field(line1[53:61]))
+
+def iter_tle_entries(tle_path, name_pattern=None, satnums=None, verify_checksum=False, errors=None):
+    # yields (line number, elements, line1, line2) for every well-formed entry whose name matches the name_pattern regex
+    # and whose NORAD ID is in satnums (any container: set, range, ...); elements is the parse_tle_elements tuple, so
+    # every reader skips the same entries. Handles 2 and 3 line files and '0 NAME' title lines; entries without a title
+    # line are named after their catalog number. Skipped entries are appended to errors as (line number, reason) when a
+    # list is given, numbered by the line the problem is on
+    def report(number, reason):
+        if errors is not None:
+            errors.append((number, reason))
+    name_regex = re.compile(name_pattern) if name_pattern is not None else None
+    name = None
+    line1 = None
+    line1_number = 0
+    skip_line2 = False # the line 1 before it was already reported, so its line 2 is dropped quietly
+    with open(tle_path, 'r', errors='replace') as tle_file:
+        for line_number, line in enumerate(tle_file, 1):
+            line = line.rstrip('\r\n')
+            if line.startswith('1 '):
+                if line1 is not None:
+                    report(line1_number, 'line 1 without a line 2')
+                line1 = None
+                skip_line2 = len(line.rstrip()) < 68
+                if skip_line2:
+                    report(line_number, 'line 1 truncated')
+                else:
+                    line1, line1_number = line, line_number
+                continue
+            if line.startswith('2 '):
+                entry_name, entry_line1 = name, line1
+                name = line1 = None
+                if entry_line1 is None:
+                    if not skip_line2:
+                        report(line_number, 'line 2 without a line 1')
+                    skip_line2 = False
+                    continue
+                if len(line.rstrip()) < 68:
+                    report(line_number, 'line 2 truncated')
+                    continue
+                try:
+                    satnum = get_tle_satnum(entry_line1[2:7])
+                    if get_tle_satnum(line[2:7]) != satnum:
+                        raise ValueError('satnum mismatch')
+                    if verify_checksum and (get_tle_checksum(entry_line1) != int(entry_line1[68]) or get_tle_checksum(line) != int(line[68])):
+                        raise ValueError('checksum mismatch')
+                except (ValueError, IndexError) as error:
+                    report(line1_number, str(error))
+                    continue
+                if entry_name is None:
+                    entry_name = str(satnum)
+                if name_regex is not None and not name_regex.search(entry_name):
+                    continue
+                if satnums is not None and satnum not in satnums:
+                    continue
+                try:
+                    elements = parse_tle_elements(entry_name, satnum, entry_line1, line)
+                except ValueError as error:
+                    report(line1_number, str(error))
+                    continue
+                yield line1_number, elements, entry_line1, line
+                continue
+            if line1 is not None:
+                report(line1_number, 'line 1 without a line 2')
+            line1 = None
+            skip_line2 = False
+            name = line[2:].strip() if line.startswith('0 ') else line.strip()
+            if not name:
+                name = None
+    if line1 is not None:
+        report(line1_number, 'line 1 without a line 2')
+
+def iter_tle_tables(tle_path, name_pattern=None, satnums=None, chunk_size=tle_chunk_size, verify_checksum=False, errors=None):
+    # yields structured tle_element_dtype arrays of at most chunk_size rows, in file order
+    rows = []
+    for _, elements, _, _ in iter_tle_entries(tle_path, name_pattern, satnums, verify_checksum, errors):
+        rows.append(elements)
+        if len(rows) == chunk_size:
+            yield np.array(rows, dtype=tle_element_dtype)
+            rows = []
+    if rows:
+        yield np.array(rows, dtype=tle_element_dtype)
+
+def read_tle_table(tle_path, name_pattern=None, satnums=None, chunk_size=tle_chunk_size, verify_checksum=False, errors=None):
+    chunks = list(iter_tle_tables(tle_path, name_pattern, satnums, chunk_size, verify_checksum, errors))
+    if not chunks:
+        return np.empty(0, dtype=tle_element_dtype)
+    return np.concatenate(chunks)
+
+def save_tle_table(table, out_path): # .npy keeps the dtype; anything else is written as CSV with a header row
+    if out_path.endswith('.npy'):
+        np.save(out_path, table)
+        return out_path
+    formats = ['%s', '%d', '%.8f', '%.4f', '%.4f', '%.7f', '%.4f', '%.4f', '%.8f', '%.5e']
+    np.savetxt(out_path, table, fmt=formats, delimiter=',', header=','.join(table.dtype.names), comments='')
+    return out_path
+
+def load_satellites(tle_path, ts, name_pattern=None, satnums=None, errors=None): # EarthSatellite only for the entries read_tle_table keeps
+    from skyfield.api import EarthSatellite
+    return [EarthSatellite(line1, line2, elements[0], ts) for _, elements, line1, line2 in iter_tle_entries(tle_path, name_pattern, satnums, errors=errors)]